@@ -0,0 +1,175 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+from scipy import sparse
+from data_handler import DataHandler, N_NEIGHBORS
+from neighbors import (
+    clear_neighbors,
+    create_neighbor_files,
+    open_neighbor_files,
+    top_k_neighbors,
+    write_neighbors_meta,
+)
+from similarity_engine import SimilarityEngine
+
+# массивы CSR-матриц, которые передаются процессам через разделяемую память
+# (у матриц оценок, квадратов и индикаторов общие indices и indptr)
+SHARED_ARRAYS = ("data", "squares", "indicators", "indices", "indptr")
+
+# состояние процесса-обработчика: блоки разделяемой памяти, движок сходства и файлы соседей
+_worker_state = {}
+
+
+def _init_worker(specs: dict, shape: tuple, path: str) -> None:
+    """
+    Инициализация процесса-обработчика: подключение к CSR-матрицам
+    в разделяемой памяти без копирования и к файлам соседей
+
+    :param dict specs: имя массива -> (имя блока, длина, тип)
+    :param tuple shape: форма матрицы оценок
+    :param str path: директория файлов соседей
+    """
+    arrays = {}
+    blocks = []
+    for name, (shm_name, length, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        blocks.append(shm)
+        arrays[name] = np.ndarray((length,), dtype=dtype, buffer=shm.buf)
+    matrices = [
+        sparse.csr_matrix(
+            (arrays[name], arrays["indices"], arrays["indptr"]), shape=shape, copy=False
+        )
+        for name in ("data", "squares", "indicators")
+    ]
+    _worker_state["blocks"] = blocks
+    _worker_state["engine"] = SimilarityEngine.from_matrix(np.arange(shape[0]), *matrices)
+    _worker_state["files"] = open_neighbor_files(path, "r+")
+
+
+def _build_block(start: int, stop: int, k: int) -> tuple[int, int]:
+    """
+    Расчет соседей строк start..stop-1 и запись их в общие файлы соседей
+
+    :return tuple[int, int]: границы блока
+    """
+    engine = _worker_state["engine"]
+    neighbor_ids, neighbor_sims = _worker_state["files"]
+    rows = np.arange(start, stop)
+    similarity, counts = engine.similarity_block(rows, return_counts=True)
+    neighbor_ids[start:stop], neighbor_sims[start:stop] = top_k_neighbors(
+        similarity, counts, rows, k
+    )
+    neighbor_ids.flush()
+    neighbor_sims.flush()
+    return start, stop
+
+
+def build_neighbors_parallel(
+    engine: SimilarityEngine,
+    path: str,
+    sources: list,
+    k: int,
+    block_size: int,
+    n_workers: int,
+) -> None:
+    """
+    Параллельный расчет ближайших соседей: строки фильмов делятся на блоки,
+    блоки считаются пулом процессов, и каждый процесс записывает свои строки
+    в заранее созданные ids.npy / sims.npy (np.lib.format.open_memmap);
+    meta.json пишется в конце
+
+    :param SimilarityEngine engine: движок расчета сходства
+    :param str path: директория для результатов
+    :param list sources: исходные файлы данных (ключ актуальности)
+    :param int k: количество соседей
+    :param int block_size: количество строк в блоке
+    :param int n_workers: количество процессов
+    """
+    matrix = engine.ratings
+    clear_neighbors(path)
+    create_neighbor_files(path, engine.n_items, k)
+
+    arrays = {
+        "data": matrix.data,
+        "squares": engine.squares.data,
+        "indicators": engine.indicators.data,
+        "indices": matrix.indices,
+        "indptr": matrix.indptr,
+    }
+    shared = []
+    specs = {}
+    try:
+        for name in SHARED_ARRAYS:
+            array = arrays[name]
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared.append(shm)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            specs[name] = (shm.name, len(array), array.dtype)
+
+        blocks = [
+            (start, min(start + block_size, engine.n_items))
+            for start in range(0, engine.n_items, block_size)
+        ]
+        done = 0
+        started = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_init_worker,
+            initargs=(specs, matrix.shape, path),
+        ) as executor:
+            futures = [
+                executor.submit(_build_block, start, stop, k) for start, stop in blocks
+            ]
+            for future in as_completed(futures):
+                start, stop = future.result()
+                done += stop - start
+                elapsed = time.perf_counter() - started
+                print(
+                    f"Обработано {done}/{engine.n_items} фильмов, "
+                    f"{done / max(elapsed, 1e-9):.0f} фильмов/с"
+                )
+        write_neighbors_meta(path, sources, k, engine.n_items)
+    finally:
+        for shm in shared:
+            shm.close()
+            shm.unlink()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Параллельный расчет ближайших соседей фильмов"
+    )
+    parser.add_argument("--k", type=int, default=N_NEIGHBORS, help="количество соседей")
+    parser.add_argument(
+        "--block-size", type=int, default=256, help="количество фильмов в блоке"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="количество процессов"
+    )
+    parser.add_argument(
+        "--output", default=None, help="директория результатов (по умолчанию — кэш данных)"
+    )
+    args = parser.parse_args()
+
+    data_handler = DataHandler()
+    data_handler.load_movielens_data(with_neighbors=False)
+    if data_handler.similarity_engine is None:
+        return
+    output = args.output or data_handler.neighbors_dir
+    started = time.perf_counter()
+    build_neighbors_parallel(
+        data_handler.similarity_engine,
+        output,
+        data_handler.sources,
+        args.k,
+        args.block_size,
+        args.workers,
+    )
+    print(f"Соседи сохранены в {output} за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
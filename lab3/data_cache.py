@@ -0,0 +1,102 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 1
+
+
+def source_signature(paths: list) -> dict:
+    """
+    Размер и время изменения исходных файлов — ключ актуальности кэша
+
+    :param list paths: пути к исходным файлам
+    :return dict: имя файла -> [размер, mtime в наносекундах]
+    """
+    signature = {}
+    for path in paths:
+        stat = os.stat(path)
+        signature[os.path.basename(path)] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def save_cache(cache_dir: str, sources: list, frames: dict, arrays: dict) -> None:
+    """
+    Сохранение разобранных данных: каждый столбец таблицы и каждый производный
+    массив — отдельный .npy, состав и ключ исходных файлов — meta.json.
+    meta.json пишется последним, поэтому недописанный кэш не будет прочитан.
+
+    :param str cache_dir: директория кэша
+    :param list sources: пути к исходным файлам
+    :param dict frames: имя таблицы -> pd.DataFrame
+    :param dict arrays: имя массива -> np.ndarray
+    """
+    meta_path = os.path.join(cache_dir, "meta.json")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        meta = {
+            "version": CACHE_VERSION,
+            "sources": source_signature(sources),
+            "frames": {},
+            "arrays": list(arrays),
+        }
+        for frame_name, frame in frames.items():
+            meta["frames"][frame_name] = list(frame.columns)
+            for i, column in enumerate(frame.columns):
+                values = frame[column]
+                if not pd.api.types.is_numeric_dtype(values):
+                    # строки хранятся как unicode-массив, пропуски — пустой строкой
+                    values = values.fillna("").to_numpy(dtype=str)
+                np.save(
+                    os.path.join(cache_dir, f"{frame_name}_{i}.npy"),
+                    np.ascontiguousarray(values),
+                )
+        for name, array in arrays.items():
+            np.save(os.path.join(cache_dir, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+    except OSError as e:
+        print(f"Не удалось сохранить кэш данных в {cache_dir}: {e}")
+
+
+def load_cache(cache_dir: str, sources: list, mmap_mode="r"):
+    """
+    Загрузка кэша, если он соответствует текущим исходным файлам.
+    Массивы открываются через np.load(mmap_mode=...).
+
+    :param str cache_dir: директория кэша
+    :param list sources: пути к исходным файлам
+    :param mmap_mode: режим отображения файлов в память (None — читать в память)
+    :return tuple[dict, dict] | None: таблицы и производные массивы или None
+    """
+    try:
+        with open(os.path.join(cache_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if (
+            meta.get("version") != CACHE_VERSION
+            or meta.get("sources") != source_signature(sources)
+        ):
+            return None
+
+        def load_array(name):
+            return np.load(
+                os.path.join(cache_dir, f"{name}.npy"),
+                mmap_mode=mmap_mode,
+                allow_pickle=False,
+            )
+
+        frames = {}
+        for frame_name, columns in meta["frames"].items():
+            data = {}
+            for i, column in enumerate(columns):
+                values = load_array(f"{frame_name}_{i}")
+                if values.dtype.kind == "U":
+                    values = pd.Series(values).replace("", np.nan)
+                data[column] = values
+            frames[frame_name] = pd.DataFrame(data, columns=columns, copy=False)
+        arrays = {name: load_array(name) for name in meta["arrays"]}
+        return frames, arrays
+    except (OSError, ValueError, KeyError):
+        return None
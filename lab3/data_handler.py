@@ -1,29 +1,105 @@
 import os
+import numpy as np
 import pandas as pd
-import random
 from dotenv import load_dotenv
-from cosine_similarity import cosine_similarity
+from data_cache import load_cache, save_cache
+from popularity_sampler import PopularitySampler
+from popularity_slates import PopularitySlates
+from similarity_engine import SimilarityEngine
+from neighbors import build_neighbors, load_neighbors, save_neighbors
 
 load_dotenv()
 
+GENRES = [
+    "Action",
+    "Adventure",
+    "Animation",
+    "Children",
+    "Comedy",
+    "Crime",
+    "Documentary",
+    "Drama",
+    "Fantasy",
+    "Film-Noir",
+    "Horror",
+    "Musical",
+    "Mystery",
+    "Romance",
+    "Sci-Fi",
+    "Thriller",
+    "War",
+    "Western",
+]
+
+# количество хранимых ближайших соседей каждого фильма
+N_NEIGHBORS = 50
+
 
 class DataHandler:
     def __init__(self):
         self.ratings = None
         self.movies = None
         self.movie_ratings = None
+        self.movie_ids = None
+        self.movie_offsets = None
+        self.movie_users = None
+        self.movie_user_ratings = None
+        self.movie_rows = None
+        self.movie_titles = None
+        self.movie_genre_masks = None
         self.popular_movies = None
+        self.popularity_sampler = None
+        self.slates = None
         self.movie_similarity = None
+        self.similarity_engine = None
+        self.neighbor_ids = None
+        self.neighbor_sims = None
+        self.neighbors_dir = None
+        self.sources = None
 
-    def load_movielens_data(self) -> None:
-        """Загрузка данных MovieLens 100K"""
+    def load_movielens_data(self, with_neighbors: bool = True) -> None:
+        """
+        Загрузка данных MovieLens 100K.
+        Разобранные таблицы и сгруппированные по фильмам оценки кэшируются
+        в DATA_CACHE_DIR/lab3 (по умолчанию cache/ внутри DATA_DIR) и при следующих
+        запусках отображаются в память, пока не изменятся исходные файлы.
+
+        :param bool with_neighbors: загрузить (при необходимости посчитать) ближайших соседей
+        """
         data_dir = os.getenv("DATA_DIR")
+        cache_dir = os.path.join(os.getenv("DATA_CACHE_DIR") or f"{data_dir}cache/", "lab3")
+        sources = [f"{data_dir}u.data", f"{data_dir}u.item"]
+        self.sources = sources
+        self.neighbors_dir = os.path.join(cache_dir, "neighbors")
+        cached = load_cache(cache_dir, sources)
+        if cached is not None:
+            frames, arrays = cached
+            self.ratings = frames["ratings"]
+            self.movies = frames["movies"]
+            for name, array in arrays.items():
+                setattr(self, name, array)
+            print(f"Загружено {len(self.ratings)} оценок (из кэша)")
+            print(f"Фильмов в базе: {len(self.movies)}")
+            self.build_movie_ratings_dict()
+            self.build_movie_index()
+            self.build_slates()
+            self.build_similarity_engine()
+            if with_neighbors:
+                self.load_neighbors()
+            return
+
         try:
             self.ratings = pd.read_csv(
                 f"{data_dir}u.data",
                 sep="\t",
                 header=None,
                 names=["user_id", "item_id", "rating", "timestamp"],
+                dtype={
+                    "user_id": np.int32,
+                    "item_id": np.int32,
+                    "rating": np.int8,
+                    "timestamp": np.int32,
+                },
             )
             self.movies = pd.read_csv(
                 f"{data_dir}u.item",
@@ -60,6 +136,22 @@ class DataHandler:
             print(f"Загружено {len(self.ratings)} оценок")
             print(f"Фильмов в базе: {len(self.movies)}")
             self.compute_movie_ratings()
+            self.build_movie_index()
+            self.build_slates()
+            self.build_similarity_engine()
+            save_cache(
+                cache_dir,
+                sources,
+                {"ratings": self.ratings, "movies": self.movies},
+                {
+                    "movie_ids": self.movie_ids,
+                    "movie_offsets": self.movie_offsets,
+                    "movie_users": self.movie_users,
+                    "movie_user_ratings": self.movie_user_ratings,
+                },
+            )
+            if with_neighbors:
+                self.load_neighbors()
 
         except FileNotFoundError:
             print("Файлы данных не найдены")
@@ -68,122 +160,234 @@ class DataHandler:
             )
 
     def compute_movie_ratings(self) -> None:
-        """Вычисление всех оценок для каждого фильма"""
+        """
+        Группировка оценок по фильмам в массивы:
+        оценки фильма movie_ids[k] лежат в movie_users / movie_user_ratings
+        на отрезке movie_offsets[k]:movie_offsets[k + 1]
+        """
         print("Вычисление оценок...")
-        self.movie_ratings = {}
-        for _, row in self.ratings.iterrows():
-            user, movie, rating = row["user_id"], row["item_id"], row["rating"]
-            if movie not in self.movie_ratings:
-                self.movie_ratings[movie] = {}
-            self.movie_ratings[movie][user] = rating
+        movies = self.ratings["item_id"].to_numpy()
+        order = np.argsort(movies, kind="stable")
+        self.movie_ids, starts = np.unique(movies[order], return_index=True)
+        self.movie_offsets = np.append(starts, len(order)).astype(np.int64)
+        self.movie_users = self.ratings["user_id"].to_numpy()[order]
+        self.movie_user_ratings = self.ratings["rating"].to_numpy()[order]
+        self.build_movie_ratings_dict()
 
-        for _, row in self.movies.iterrows():
-            movie = row["item_id"]
-            if movie not in self.movie_ratings:
-                self.movie_ratings[movie] = {}
+    def build_movie_ratings_dict(self) -> None:
+        """Построение словаря оценок фильмов {фильм: {пользователь: оценка}}"""
+        users = self.movie_users.tolist()
+        ratings = self.movie_user_ratings.tolist()
+        bounds = self.movie_offsets.tolist()
+        self.movie_ratings = {
+            movie: dict(zip(users[start:end], ratings[start:end]))
+            for movie, start, end in zip(self.movie_ids.tolist(), bounds[:-1], bounds[1:])
+        }
+        for movie in self.movies["item_id"].tolist():
+            self.movie_ratings.setdefault(movie, {})
+        self.popularity_sampler = PopularitySampler(
+            list(self.movie_ratings),
+            [len(user_ratings) for user_ratings in self.movie_ratings.values()],
+        )
 
-    def compute_movie_similarity(self, target_movie: int) -> None:
+    def build_slates(self) -> None:
+        """Построение подборок популярных и высоко оцененных фильмов (в целом и по жанрам)"""
+        movies = list(self.movie_ratings)
+        counts = [len(user_ratings) for user_ratings in self.movie_ratings.values()]
+        sums = [sum(user_ratings.values()) for user_ratings in self.movie_ratings.values()]
+        rows = self.get_movie_rows(movies)
+        masks = np.where(rows >= 0, self.movie_genre_masks[rows], 0)
+        self.slates = PopularitySlates(movies, counts, sums, masks, len(GENRES))
+
+    def build_similarity_engine(self) -> None:
+        """
+        Построение разреженной матрицы фильм x пользователь для расчета сходства
+        (кэш посчитанных строк сходства сбрасывается)
+        """
+        self.similarity_engine = SimilarityEngine(
+            self.movies["item_id"].to_numpy(),
+            self.ratings["item_id"].to_numpy(),
+            self.ratings["user_id"].to_numpy(),
+            self.ratings["rating"].to_numpy(),
+        )
+        self.movie_similarity = {}
+
+    def load_neighbors(self) -> None:
+        """
+        Загрузка N_NEIGHBORS ближайших соседей каждого фильма из neighbors_dir
+        (их можно заранее посчитать параллельно скриптом build_neighbors.py),
+        а если они не посчитаны для текущих данных — расчет и сохранение.
+        neighbor_ids[r] — номера строк movies самых похожих на фильм строки r
+        фильмов, neighbor_sims[r] — их сходства по убыванию.
+        """
+        loaded = load_neighbors(
+            self.neighbors_dir, self.sources, N_NEIGHBORS, len(self.movies)
+        )
+        if loaded is None:
+            print("Расчет ближайших соседей фильмов...")
+            loaded = build_neighbors(self.similarity_engine, N_NEIGHBORS)
+            save_neighbors(self.neighbors_dir, self.sources, *loaded)
+        self.neighbor_ids, self.neighbor_sims = loaded
+
+    def compute_movie_similarity(self, target_movie: int) -> dict:
         """
         Вычисление косинусного сходства между заданным фильмом и всеми остальными.
+        Вся строка сходства считается одним разреженным произведением один раз,
+        затем берется из movie_similarity: оценки фильмов меняются только
+        при загрузке данных, и вместе с движком сходства сбрасывается кэш строк.
 
         :param int target_movie: ID целевого фильма
+        :return dict: сходство с каждым фильмом каталога {ID фильма: сходство}
         """
-        if not self.movie_similarity:
-            self.movie_similarity = {}
+        if target_movie not in self.similarity_engine.movie_index:
+            return {}
         if target_movie not in self.movie_similarity:
-            self.movie_similarity[target_movie] = {}
-        # если матрица пустая — инициализируем словари для всех фильмов
-        for _, row in self.movies.iterrows():
-            movie = row["item_id"]
-            if movie not in self.movie_similarity:
-                self.movie_similarity[movie] = {}
-
-        for _, row in self.movies.iterrows():
-            movie = row["item_id"]
-            # вычисляем сходство только если ещё не посчитано
-            if movie == target_movie:
-                self.movie_similarity[target_movie][movie] = 1.0
-                continue
-            # избежать повторных вычислений
-            if (
-                movie in self.movie_similarity
-                and target_movie in self.movie_similarity[movie]
-                and self.movie_similarity[movie][target_movie] is not None
-            ):
-                self.movie_similarity[target_movie][movie] = self.movie_similarity[movie][
-                    target_movie
-                ]
-                continue
-            similarity = cosine_similarity(
-                self.movie_ratings.get(target_movie, {}),
-                self.movie_ratings.get(movie, {}),
+            self.movie_similarity[target_movie] = dict(
+                zip(
+                    self.similarity_engine.movie_ids.tolist(),
+                    self.similarity_engine.similarity_row(target_movie).tolist(),
+                )
             )
-            # сохраняем симметрично
-            self.movie_similarity[target_movie][movie] = similarity
-            self.movie_similarity[movie][target_movie] = similarity
+        return self.movie_similarity[target_movie]
+
+    def build_movie_index(self) -> None:
+        """
+        Построение индекса фильмов: movie_rows[item_id] — номер строки в movies
+        (-1, если фильма нет), названия — списком, жанры — битовой маской uint32
+        (бит i соответствует GENRES[i])
+        """
+        item_ids = self.movies["item_id"].to_numpy()
+        self.movie_rows = np.full(item_ids.max() + 1, -1, dtype=np.int32)
+        self.movie_rows[item_ids] = np.arange(len(item_ids), dtype=np.int32)
+        self.movie_titles = self.movies["title"].tolist()
+        flags = self.movies[GENRES].to_numpy() == 1
+        bits = np.left_shift(np.uint32(1), np.arange(len(GENRES), dtype=np.uint32))
+        self.movie_genre_masks = (flags * bits).sum(axis=1).astype(np.uint32)
+
+    def get_movie_rows(self, movie_ids) -> np.ndarray:
+        """Номера строк фильмов в таблице movies (-1 для неизвестных ID)"""
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        known = (movie_ids >= 0) & (movie_ids < len(self.movie_rows))
+        rows = np.full(len(movie_ids), -1, dtype=np.int32)
+        rows[known] = self.movie_rows[movie_ids[known]]
+        return rows
+
+    def get_movie_titles(self, movie_ids) -> list:
+        """Получение названий нескольких фильмов по ID"""
+        movie_ids = list(movie_ids)
+        return [
+            self.movie_titles[row] if row >= 0 else f"Фильм {movie_id}"
+            for movie_id, row in zip(movie_ids, self.get_movie_rows(movie_ids).tolist())
+        ]
+
+    def get_movie_genres_batch(self, movie_ids) -> list:
+        """Получение жанров нескольких фильмов"""
+        rows = self.get_movie_rows(list(movie_ids))
+        masks = np.where(rows >= 0, self.movie_genre_masks[rows], 0).tolist()
+        return [
+            [genre for i, genre in enumerate(GENRES) if mask >> i & 1]
+            for mask in masks
+        ]
 
     def get_movie_title(self, movie_id: int) -> str:
         """Получение названия фильма по ID"""
-        movie_info = self.movies[self.movies["item_id"] == movie_id]
-        if len(movie_info) > 0:
-            return movie_info["title"].values[0]
-        return f"Фильм {movie_id}"
+        return self.get_movie_titles([movie_id])[0]
 
     def get_movie_genres(self, movie_id: int) -> list:
         """Получение жанров фильма"""
-        genre_columns = [
-            "Action",
-            "Adventure",
-            "Animation",
-            "Children",
-            "Comedy",
-            "Crime",
-            "Documentary",
-            "Drama",
-            "Fantasy",
-            "Film-Noir",
-            "Horror",
-            "Musical",
-            "Mystery",
-            "Romance",
-            "Sci-Fi",
-            "Thriller",
-            "War",
-            "Western",
-        ]
-        movie_info = self.movies[self.movies["item_id"] == movie_id]
-        genres = []
-        if len(movie_info) == 0:
-            return genres
-        for genre in genre_columns:
-            if movie_info[genre].values[0] == 1:
-                genres.append(genre)
-        return genres
+        return self.get_movie_genres_batch([movie_id])[0]
 
     def get_movies_data(self) -> list:
         """Получение списка ID всех фильмов"""
         return self.movies["item_id"].tolist()
 
+    def get_similarity_rows(self, movie_ids) -> np.ndarray:
+        """
+        Сходство нескольких фильмов со всеми фильмами каталога по спискам
+        ближайших соседей (столбцы — в порядке строк movies)
+        """
+        rows = self.get_movie_rows(list(movie_ids))
+        similarities = np.zeros((len(rows), len(self.movie_titles)))
+        known = np.flatnonzero(rows >= 0)
+        if len(known) == 0:
+            return similarities
+
+        # соседи самих фильмов
+        neighbor_ids = self.neighbor_ids[rows[known]]
+        valid = neighbor_ids >= 0
+        owners = np.broadcast_to(known[:, None], neighbor_ids.shape)
+        similarities[owners[valid], neighbor_ids[valid]] = self.neighbor_sims[rows[known]][valid]
+        # фильмы, у которых заданные фильмы входят в соседи
+        positions = np.full(len(self.movie_titles), -1)
+        positions[rows[known]] = known
+        hits = np.isin(self.neighbor_ids, rows[known])
+        candidates, slots = np.nonzero(hits)
+        owners = positions[self.neighbor_ids[candidates, slots]]
+        similarities[owners, candidates] = np.maximum(
+            similarities[owners, candidates], self.neighbor_sims[candidates, slots]
+        )
+        similarities[known, rows[known]] = 1.0
+        return similarities
+
+    def get_movie_similarities(self, movie_id: int, movie_ids) -> np.ndarray:
+        """
+        Сходство фильма с несколькими фильмами по спискам ближайших соседей.
+        Сходство пары известно, если один из фильмов входит в соседи другого,
+        иначе оно считается нулевым.
+        """
+        rows = self.get_movie_rows(list(movie_ids))
+        target = self.get_movie_rows([movie_id])[0]
+        similarities = np.zeros(len(rows))
+        if target < 0:
+            return similarities
+        known = rows >= 0
+        forward = self.neighbor_ids[target][None, :] == rows[known][:, None]
+        backward = self.neighbor_ids[rows[known]] == target
+        similarities[known] = np.maximum(
+            np.where(forward, self.neighbor_sims[target][None, :], 0).max(axis=1, initial=0),
+            np.where(backward, self.neighbor_sims[rows[known]], 0).max(axis=1, initial=0),
+        )
+        similarities[rows == target] = 1.0
+        return similarities
+
     def get_movie_similarity(self, movie1: int, movie2: int) -> float:
         """Получить значение косинусного сходства между двумя фильмами (если есть)"""
-        if (
-            self.movie_similarity
-            and movie1 in self.movie_similarity
-            and movie2 in self.movie_similarity[movie1]
-        ):
-            return self.movie_similarity[movie1][movie2]
-        return 0.0
+        return float(self.get_movie_similarities(movie1, [movie2])[0])
 
-    def get_popular_movie(self) -> int:
+    def get_popular_movie(self, exclude=()) -> int:
         """
         Возвращает фильм, выбранный случайно с весами, зависящими от количества оценок.
-        Чем больше оценок — тем выше шанс.
+        Чем больше оценок — тем выше шанс. Фильмы из exclude не выбираются;
+        если исключены все фильмы, возвращается None.
+        """
+        movies = self.popularity_sampler.sample(1, exclude)
+        return movies[0] if movies else None
+
+    def get_onboarding_movie(self, exclude=()) -> int:
         """
-        all_movies = []
-        weights = []
-        for movie, user_ratings in self.movie_ratings.items():
-            all_movies.append(movie)
-            weights.append(len(user_ratings) ** 2 + 1)
+        Возвращает первый фильм из подборки самых популярных фильмов, не входящий в exclude,
+        а если подборка исчерпана — случайный популярный фильм
+        """
+        movies = PopularitySlates.take([self.slates.popular[None]], 1, exclude)
+        return movies[0] if movies else self.get_popular_movie(exclude)
+
+    def get_cold_start_movies(self, user_ratings: dict, k: int) -> list:
+        """
+        Рекомендации без модели: высоко оцененные фильмы из подборок жанров,
+        которые пользователь оценил выше всего, затем из общей подборки
+        """
+        liked = [movie for movie, rating in user_ratings.items() if rating >= 4]
+        rows = self.get_movie_rows(liked or list(user_ratings))
+        masks = self.movie_genre_masks[rows[rows >= 0]]
+        genre_counts = [int(((masks >> i) & 1).sum()) for i in range(len(GENRES))]
+        genres = [
+            genre
+            for genre in np.argsort(genre_counts, kind="stable")[::-1][:3].tolist()
+            if genre_counts[genre] > 0
+        ]
+        slates = [self.slates.top[genre] for genre in genres] + [self.slates.top[None]]
+        return PopularitySlates.take(slates, k, exclude=user_ratings.keys())
 
-        popular_movies = random.choices(all_movies, weights=weights, k=1)
-        return popular_movies[0]
+    def get_popular_movies(self, k: int, exclude=()) -> list:
+        """Возвращает k различных популярных фильмов, не входящих в exclude"""
+        return self.popularity_sampler.sample(k, exclude)
@@ -0,0 +1,72 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ModelExecutor:
+    def __init__(self):
+        """
+        Выполнение вычислений модели вне цикла событий бота.
+
+        Вызовы уходят в отдельный поток через loop.run_in_executor, поэтому
+        цикл событий и обработчики, которым модель не нужна, не ждут обучения
+        и расчета рекомендаций. Модель не потокобезопасна, поэтому поток один
+        и все вызовы модели выполняются последовательно. Вызовы одного
+        пользователя выполняются строго по очереди, а одинаковые вызовы,
+        пришедшие, пока предыдущий еще считается (например, повторное нажатие
+        /show_recommendations), объединяются в один.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+        self.user_locks = {}
+        self.user_waiting = {}
+        self.pending = {}
+
+    async def _run_ordered(self, user_id: int, func, args: tuple):
+        """Вызов после завершения предыдущих вызовов того же пользователя"""
+        lock = self.user_locks.setdefault(user_id, asyncio.Lock())
+        self.user_waiting[user_id] = self.user_waiting.get(user_id, 0) + 1
+        try:
+            async with lock:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.user_waiting[user_id] -= 1
+            if self.user_waiting[user_id] == 0:
+                del self.user_waiting[user_id]
+                del self.user_locks[user_id]
+
+    async def run(self, user_id: int, func, *args, coalesce: bool = False):
+        """
+        Выполнение func(*args) в потоке модели
+
+        :param int user_id: ID пользователя, от имени которого выполняется вызов
+        :param func: функция модели
+        :param args: аргументы функции
+        :param bool coalesce: объединять с таким же незавершенным вызовом
+        :return: результат func
+        """
+        if not coalesce:
+            return await self._run_ordered(user_id, func, args)
+
+        key = (user_id, func, args)
+        if key in self.pending:
+            return await asyncio.shield(self.pending[key])
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        try:
+            result = await self._run_ordered(user_id, func, args)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # ошибка передается вызывающему ниже, ожидающие получат ее из future
+            future.exception()
+            raise
+        finally:
+            del self.pending[key]
+
+    def shutdown(self) -> None:
+        """Остановка потока модели"""
+        self.executor.shutdown(wait=False)
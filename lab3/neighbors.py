@@ -0,0 +1,181 @@
+import json
+import os
+import numpy as np
+from data_cache import source_signature
+
+
+# сглаживание при отборе соседей: sim * n / (n + NEIGHBOR_SHRINKAGE)
+NEIGHBOR_SHRINKAGE = 2.0
+
+
+def top_k_neighbors(
+    similarity: np.ndarray,
+    counts: np.ndarray,
+    rows,
+    k: int,
+    shrinkage: float = NEIGHBOR_SHRINKAGE,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Выбор k ближайших соседей для каждой строки блока сходства.
+
+    Косинус на общих пользователях равен 1 почти у всех пар с двумя-тремя
+    общими оценками, поэтому соседи отбираются по сходству, уменьшенному
+    для пар с малым числом общих пользователей n: sim * n / (n + shrinkage).
+    Сохраняется исходное сходство.
+
+    :param np.ndarray similarity: сходства строк блока со всеми фильмами (len(rows), n_items)
+    :param np.ndarray counts: число общих пользователей той же формы
+    :param rows: номера строк блока (сам фильм в соседи не попадает)
+    :param int k: количество соседей
+    :param float shrinkage: параметр сглаживания при отборе
+    :return tuple[np.ndarray, np.ndarray]: номера соседей (int32, -1 — нет соседа)
+        и их сходства (float32), по убыванию сходства
+    """
+    score = similarity * counts / (counts + shrinkage)
+    n_rows, n_items = similarity.shape
+    score[np.arange(n_rows), rows] = -np.inf
+    ids = np.full((n_rows, k), -1, dtype=np.int32)
+    sims = np.zeros((n_rows, k), dtype=np.float32)
+    width = min(k, n_items - 1)
+    if width <= 0:
+        return ids, sims
+
+    top = np.argpartition(-score, width - 1, axis=1)[:, :width]
+    top_sims = np.take_along_axis(similarity, top, axis=1)
+    order = np.argsort(-top_sims, axis=1, kind="stable")
+    ids[:, :width] = np.take_along_axis(top, order, axis=1)
+    sims[:, :width] = np.take_along_axis(top_sims, order, axis=1)
+    return ids, sims
+
+
+def build_neighbors(engine, k: int, block_size: int = 256) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Расчет k ближайших соседей всех фильмов блоками строк матрицы сходства
+
+    :param SimilarityEngine engine: движок расчета сходства
+    :param int k: количество соседей
+    :param int block_size: количество строк в блоке
+    :return tuple[np.ndarray, np.ndarray]: матрицы (n_items, k) номеров соседей и сходств
+    """
+    ids = np.empty((engine.n_items, k), dtype=np.int32)
+    sims = np.empty((engine.n_items, k), dtype=np.float32)
+    for start in range(0, engine.n_items, block_size):
+        rows = np.arange(start, min(start + block_size, engine.n_items))
+        similarity, counts = engine.similarity_block(rows, return_counts=True)
+        ids[rows], sims[rows] = top_k_neighbors(similarity, counts, rows, k)
+    return ids, sims
+
+
+def clear_neighbors(path: str) -> None:
+    """
+    Удаление сохраненных соседей (meta.json и файлов соседей)
+
+    :param str path: директория
+    """
+    if not os.path.isdir(path):
+        return
+    for name in os.listdir(path):
+        if name == "meta.json" or (
+            name.endswith(".npy") and name.startswith(("ids", "sims"))
+        ):
+            os.remove(os.path.join(path, name))
+
+
+def create_neighbor_files(path: str, n_items: int, k: int) -> None:
+    """
+    Создание пустых файлов ids.npy и sims.npy формы (n_items, k), которые
+    затем заполняются по диапазонам строк (open_neighbor_files)
+
+    :param str path: директория
+    :param int n_items: количество фильмов
+    :param int k: количество соседей
+    """
+    os.makedirs(path, exist_ok=True)
+    for name, dtype in (("ids", np.int32), ("sims", np.float32)):
+        array = np.lib.format.open_memmap(
+            os.path.join(path, f"{name}.npy"), mode="w+", dtype=dtype, shape=(n_items, k)
+        )
+        array.flush()
+        del array
+
+
+def open_neighbor_files(path: str, mode: str = "r+") -> tuple[np.ndarray, np.ndarray]:
+    """
+    Открытие файлов соседей, отображенных в память
+
+    :param str path: директория
+    :param str mode: режим np.load(mmap_mode=...)
+    :return tuple[np.ndarray, np.ndarray]: номера и сходства соседей
+    """
+    return (
+        np.load(os.path.join(path, "ids.npy"), mmap_mode=mode),
+        np.load(os.path.join(path, "sims.npy"), mmap_mode=mode),
+    )
+
+
+def write_neighbors_meta(path: str, sources: list, k: int, n_items: int) -> None:
+    """
+    Запись meta.json после того, как файлы соседей полностью заполнены
+
+    :param str path: директория
+    :param list sources: пути к исходным файлам данных
+    :param int k: количество соседей
+    :param int n_items: количество фильмов
+    """
+    meta = {
+        "k": k,
+        "n_items": n_items,
+        "shrinkage": NEIGHBOR_SHRINKAGE,
+        "sources": source_signature(sources),
+    }
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def save_neighbors(path: str, sources: list, ids: np.ndarray, sims: np.ndarray) -> None:
+    """
+    Сохранение соседей
+
+    :param str path: директория
+    :param list sources: пути к исходным файлам данных
+    :param np.ndarray ids: номера соседей
+    :param np.ndarray sims: сходства соседей
+    """
+    try:
+        clear_neighbors(path)
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "ids.npy"), ids)
+        np.save(os.path.join(path, "sims.npy"), sims)
+        write_neighbors_meta(path, sources, ids.shape[1], ids.shape[0])
+    except OSError as e:
+        print(f"Не удалось сохранить соседей в {path}: {e}")
+
+
+def load_neighbors(path: str, sources: list, k: int, n_items: int, mmap_mode="r"):
+    """
+    Загрузка соседей, если они посчитаны для тех же данных, k и каталога.
+    Файлы открываются через np.load(mmap_mode=...) без копирования в память.
+
+    :param str path: директория
+    :param list sources: пути к исходным файлам данных
+    :param int k: количество соседей
+    :param int n_items: количество фильмов
+    :param mmap_mode: режим отображения файлов в память
+    :return tuple[np.ndarray, np.ndarray] | None: номера и сходства соседей или None
+    """
+    try:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if (
+            meta.get("k") != k
+            or meta.get("n_items") != n_items
+            or meta.get("shrinkage") != NEIGHBOR_SHRINKAGE
+            or meta.get("sources") != source_signature(sources)
+        ):
+            return None
+        ids, sims = open_neighbor_files(path, mmap_mode)
+        if ids.shape != (n_items, k) or sims.shape != (n_items, k):
+            return None
+        return ids, sims
+    except (OSError, ValueError, KeyError):
+        return None
@@ -0,0 +1,65 @@
+import numpy as np
+
+
+class PopularitySampler:
+    def __init__(self, items, counts, seed: int = None, max_rounds: int = 8):
+        """
+        Случайный выбор фильмов с весами cnt^2 + 1 по числу оценок.
+
+        Кумулятивные суммы весов считаются один раз, каждый выбор — двоичный
+        поиск (np.searchsorted) по случайному числу. Исключенные и уже выбранные
+        фильмы отбрасываются и выбор повторяется; если исключена большая часть
+        массы или повторов слишком много, выбор идет по явно перенормированным весам.
+
+        :param items: ID фильмов
+        :param counts: количество оценок каждого фильма
+        :param int seed: зерно генератора случайных чисел
+        :param int max_rounds: число раундов с отбрасыванием до перехода к точному выбору
+        """
+        self.items = np.asarray(items)
+        self.weights = np.asarray(counts, dtype=np.float64) ** 2 + 1
+        self.cumulative = np.cumsum(self.weights)
+        self.total = float(self.cumulative[-1]) if len(self.cumulative) else 0.0
+        self.positions = {item: i for i, item in enumerate(self.items.tolist())}
+        self.rng = np.random.default_rng(seed)
+        self.max_rounds = max_rounds
+
+    def sample(self, k: int = 1, exclude=()) -> list:
+        """
+        Выбор k различных фильмов, не входящих в exclude
+
+        :param int k: количество фильмов
+        :param exclude: ID фильмов, которые нельзя выбирать
+        :return list: ID фильмов (меньше k, если доступных фильмов не хватает)
+        """
+        seen = {self.positions[item] for item in exclude if item in self.positions}
+        k = min(k, len(self.items) - len(seen))
+        if k <= 0:
+            return []
+
+        excluded_mass = float(self.weights[list(seen)].sum()) if seen else 0.0
+        chosen = []
+        rounds = 0 if excluded_mass <= self.total / 2 else self.max_rounds
+        while len(chosen) < k and rounds < self.max_rounds:
+            rounds += 1
+            draws = np.searchsorted(
+                self.cumulative,
+                self.rng.random(2 * (k - len(chosen))) * self.total,
+                side="right",
+            )
+            for position in draws.tolist():
+                if position not in seen:
+                    seen.add(position)
+                    chosen.append(position)
+                    if len(chosen) == k:
+                        break
+
+        if len(chosen) < k:
+            weights = self.weights.copy()
+            weights[list(seen)] = 0.0
+            chosen.extend(
+                self.rng.choice(
+                    len(weights), k - len(chosen), replace=False, p=weights / weights.sum()
+                ).tolist()
+            )
+        return self.items[chosen].tolist()
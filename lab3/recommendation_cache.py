@@ -0,0 +1,94 @@
+import time
+from collections import OrderedDict
+
+
+class RecommendationCache:
+    def __init__(self, max_size: int = 1024, ttl: float = 600.0):
+        """
+        LRU-кэш готовых рекомендаций с ограниченным временем жизни записей.
+
+        Ключ — (ID пользователя, версия его оценок, количество рекомендаций).
+        Версия меняется при каждом изменении оценок, поэтому устаревшая запись
+        никогда не выдается; при записи новой версии старые записи пользователя
+        удаляются сразу, а всего хранится не больше max_size записей
+        (вытесняются давно не использованные).
+
+        :param int max_size: максимальное количество записей
+        :param float ttl: время жизни записи, с
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.user_keys = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, version: int, n: int):
+        """
+        Получение рекомендаций из кэша
+
+        :param int user_id: ID пользователя
+        :param int version: версия оценок пользователя
+        :param int n: количество рекомендаций
+        :return: сохраненные рекомендации или None
+        """
+        key = (user_id, version, n)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user_id: int, version: int, n: int, recommendations) -> None:
+        """
+        Сохранение рекомендаций
+
+        :param int user_id: ID пользователя
+        :param int version: версия оценок пользователя
+        :param int n: количество рекомендаций
+        :param recommendations: рекомендации
+        """
+        for key in list(self.user_keys.get(user_id, ())):
+            if key[1] != version:
+                self._remove(key)
+        key = (user_id, version, n)
+        self.entries[key] = (time.monotonic() + self.ttl, recommendations)
+        self.entries.move_to_end(key)
+        self.user_keys.setdefault(user_id, set()).add(key)
+        while len(self.entries) > self.max_size:
+            self._remove(next(iter(self.entries)))
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Удаление всех записей пользователя
+
+        :param int user_id: ID пользователя
+        """
+        for key in list(self.user_keys.get(user_id, ())):
+            self._remove(key)
+
+    def clear(self) -> None:
+        """Удаление всех записей (счетчики сохраняются)"""
+        self.entries.clear()
+        self.user_keys.clear()
+
+    def _remove(self, key: tuple) -> None:
+        """Удаление записи"""
+        del self.entries[key]
+        keys = self.user_keys[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self.user_keys[key[0]]
+
+    def stats(self) -> dict:
+        """
+        Статистика кэша
+
+        :return dict: количество попаданий, промахов и записей
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
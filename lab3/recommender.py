@@ -1,10 +1,29 @@
+import numpy as np
 from data_handler import DataHandler
+from recommendation_cache import RecommendationCache
 
 
 class VirtualUserRecommender:
-    def __init__(self, data_handler: DataHandler):
+    def __init__(
+        self,
+        data_handler: DataHandler,
+        cache_size: int = 1024,
+        cache_ttl: float = 600.0,
+        user_store=None,
+    ):
+        """
+        :param DataHandler data_handler: обработчик данных
+        :param int cache_size: максимальное количество сохраненных списков рекомендаций
+        :param float cache_ttl: время жизни сохраненных рекомендаций, с
+        :param UserStore user_store: хранилище виртуальных пользователей или None
+        """
         self.dh = data_handler
         self.virtual_users = {}
+        self.ratings_version = 0
+        self.user_versions = {}
+        self.recommendation_cache = RecommendationCache(cache_size, cache_ttl)
+        self.user_store = user_store
+        self.loaded_users = set()
 
     def create_virtual_user(self, user_id: int) -> None:
         """
@@ -12,7 +31,11 @@ class VirtualUserRecommender:
 
         :param int user_id: ID пользователя
         """
+        self.loaded_users.add(user_id)
         self.virtual_users[user_id] = {}
+        self.bump_ratings_version(user_id)
+        if self.user_store is not None:
+            self.user_store.create_user(user_id)
         print(f"Создан виртуальный пользователь {user_id}")
 
     def update_virtual_user(self, user_id: int, movie_id: int, rating: int) -> None:
@@ -23,9 +46,13 @@ class VirtualUserRecommender:
         :param int movie_id: ID фильма
         :param int rating: оценка фильма
         """
+        self.load_virtual_user(user_id)
         if user_id not in self.virtual_users:
             self.create_virtual_user(user_id)
         self.virtual_users[user_id][movie_id] = rating
+        self.bump_ratings_version(user_id)
+        if self.user_store is not None:
+            self.user_store.set_rating(user_id, movie_id, rating)
         movie_title = self.dh.get_movie_title(movie_id)
 
         print(
@@ -38,10 +65,42 @@ class VirtualUserRecommender:
 
         :param int user_id: ID пользователя
         """
+        self.loaded_users.add(user_id)
+        if self.user_store is not None:
+            self.user_store.delete_user(user_id)
         if user_id in self.virtual_users.keys():
             del self.virtual_users[user_id]
+            self.bump_ratings_version(user_id)
+            self.recommendation_cache.invalidate(user_id)
             print(f"Удален виртуальный пользователь {user_id}")
 
+    def load_virtual_user(self, user_id: int) -> None:
+        """
+        Загрузка пользователя из user_store при первом обращении к нему после запуска
+
+        :param int user_id: ID пользователя
+        """
+        if self.user_store is None or user_id in self.loaded_users:
+            return
+        self.loaded_users.add(user_id)
+        ratings = self.user_store.load_user(user_id)
+        if ratings is None:
+            return
+        # восстановление без повторной записи в хранилище
+        user_store, self.user_store = self.user_store, None
+        try:
+            self.create_virtual_user(user_id)
+            for movie_id, rating in ratings.items():
+                self.update_virtual_user(user_id, movie_id, rating)
+        finally:
+            self.user_store = user_store
+        print(f"Виртуальный пользователь {user_id} загружен из хранилища")
+
+    def bump_ratings_version(self, user_id: int) -> None:
+        """Новая версия оценок пользователя: сохраненные рекомендации больше не выдаются"""
+        self.ratings_version += 1
+        self.user_versions[user_id] = self.ratings_version
+
     def predict_rating(self, user_id: int, movie_id: int) -> tuple[float, float]:
         """
         Предсказание оценки для виртуального пользователя и фильма
@@ -54,25 +113,55 @@ class VirtualUserRecommender:
         if movie_id in user_ratings.keys():
             return user_ratings[movie_id], 0
 
-        similarities = []
-        for rated_movie, rating in user_ratings.items():
-            sim = self.dh.get_movie_similarity(rated_movie, movie_id)
-            if sim > 0:
-                similarities.append((sim, rating))
-        if not similarities:
+        rated_movies = list(user_ratings.keys())
+        ratings = np.array(list(user_ratings.values()), dtype=np.float64)
+        similarities = self.dh.get_movie_similarities(movie_id, rated_movies)
+        positive = similarities > 0
+        if not positive.any():
             # если нет похожих фильмов — возвращаем среднюю оценку виртуального пользователя
             mean = self.get_virtual_user_mean(user_id)
             return mean, 0
 
-        numerator = 0.0
-        denominator = 0.0
-        for sim, rating in similarities:
-            numerator += sim * rating
-            denominator += sim
-        if denominator == 0:
-            return self.get_virtual_user_mean(user_id), 0
+        denominator = float(similarities[positive].sum())
+        numerator = float(similarities[positive] @ ratings[positive])
         return numerator / denominator, denominator
 
+    def predict_all(self, user_id: int, n_explanations: int = 3) -> tuple:
+        """
+        Предсказание оценок виртуального пользователя для всех фильмов каталога
+        одним умножением: столбцы сходства оцененных фильмов собираются в матрицу,
+        отрицательные и нулевые сходства обнуляются. Заодно для каждого фильма
+        запоминаются оцененные фильмы с наибольшим вкладом (сходством).
+
+        :param int user_id: ID пользователя
+        :param int n_explanations: сколько оцененных фильмов запоминать для объяснения
+        :return tuple: предсказанные оценки, суммы схожестей (в порядке get_movies_data),
+            номера оцененных фильмов с наибольшим сходством (n_items, n_explanations;
+            -1 — нет фильма) в порядке оценок пользователя и их сходства
+        """
+        user_ratings = self.virtual_users.get(user_id, {})
+        ratings = np.array(list(user_ratings.values()), dtype=np.float64)
+        similarities = self.dh.get_similarity_rows(user_ratings.keys())
+        similarities[similarities < 0] = 0.0
+        sim_sums = similarities.sum(axis=0)
+        numerators = ratings @ similarities
+        pred_ratings = np.full(len(sim_sums), self.get_virtual_user_mean(user_id))
+        positive = sim_sums > 0
+        pred_ratings[positive] = numerators[positive] / sim_sums[positive]
+
+        n_top = min(n_explanations, len(ratings))
+        top_rated = np.full((len(sim_sums), n_explanations), -1)
+        top_sims = np.zeros((len(sim_sums), n_explanations))
+        if n_top > 0:
+            top = np.argpartition(-similarities, n_top - 1, axis=0)[:n_top].T
+            sims = np.take_along_axis(similarities.T, top, axis=1)
+            order = np.argsort(-sims, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            sims = np.take_along_axis(sims, order, axis=1)
+            top_rated[:, :n_top] = np.where(sims > 0, top, -1)
+            top_sims[:, :n_top] = sims
+        return pred_ratings, sim_sums, top_rated, top_sims
+
     def get_virtual_user_mean(self, user_id: int) -> float:
         """
         Расчет средней оценки виртуального пользователя
@@ -87,48 +176,63 @@ class VirtualUserRecommender:
 
     def recommend_for_virtual_user(self, user_id: int, n=5) -> list:
         """
-        Рекомендация топ-n фильмов для виртуального пользователя
+        Рекомендация топ-n фильмов для виртуального пользователя.
+        Результат сохраняется в recommendation_cache и выдается повторно,
+        пока оценки пользователя не изменятся.
 
         :param int user_id: ID пользователя
         :param int n: количество рекомендаций
-        :return list: список рекомендаций
+        :return list: список рекомендаций (ID фильма, предсказанная оценка, сумма схожестей,
+            объяснение — до трех оцененных фильмов с наибольшим сходством в виде словарей
+            movie_id / similarity / rating)
         """
+        self.load_virtual_user(user_id)
         if user_id not in self.virtual_users:
             print(f"Виртуальный пользователь {user_id} не найден")
             return []
+        version = self.user_versions.get(user_id)
+        cached = self.recommendation_cache.get(user_id, version, n)
+        if cached is not None:
+            return cached
 
         user_ratings = self.virtual_users[user_id]
         rated_movies = set(user_ratings.keys())
-        all_movies = set(self.dh.get_movies_data())
-        unrated_movies = all_movies - rated_movies
+        pred_ratings, sim_sums, top_rated, top_sims = self.predict_all(user_id)
+        movie_ids = np.asarray(self.dh.get_movies_data())
+        candidates = np.flatnonzero(~np.isin(movie_ids, list(rated_movies)))
+        if len(candidates) > n:
+            # все фильмы, не уступающие n-му по оценке, затем сортировка с учетом суммы схожестей
+            threshold = np.partition(pred_ratings[candidates], len(candidates) - n)[
+                len(candidates) - n
+            ]
+            candidates = candidates[pred_ratings[candidates] >= threshold]
+        order = np.lexsort((-sim_sums[candidates], -pred_ratings[candidates]))[:n]
+        top = candidates[order]
+
+        rated_list = list(user_ratings.items())
         predictions = []
-
-        movies_to_process = list(unrated_movies)
-        for movie_id in movies_to_process:
-            pred_rating, sim_sum = self.predict_rating(user_id, movie_id)
-            predictions.append((movie_id, pred_rating, sim_sum))
-        predictions.sort(key=lambda x: (x[1], x[2]), reverse=True)
-        if len(predictions) > n:
-            predictions = predictions[:n]
-
-        print(f"Вычислены рекомендации для виртуального пользователя {user_id}")
-        for pred_movie in predictions:
-            print(f"Фильм {self.dh.get_movie_title(pred_movie[0])}")
-            sims = []
-            for rated_movie in rated_movies:
-                sims.append(
-                    (
-                        self.dh.get_movie_similarity(pred_movie[0], rated_movie),
-                        rated_movie,
-                    )
+        for row in top.tolist():
+            explanation = [
+                {
+                    "movie_id": rated_list[index][0],
+                    "similarity": similarity,
+                    "rating": rated_list[index][1],
+                }
+                for index, similarity in zip(
+                    top_rated[row].tolist(), top_sims[row].tolist()
                 )
-            top_sims = sorted(
-                [x for x in sims if x[0] > 0], key=lambda x: x[0], reverse=True
-            )[:3]
-            for sim, movie_id in top_sims:
-                print(
-                    f"  {self.dh.get_movie_title(movie_id)}, схожесть: {sim}, оценка пользователя: {self.virtual_users[user_id][movie_id]}"
+                if index >= 0
+            ]
+            predictions.append(
+                (
+                    int(movie_ids[row]),
+                    float(pred_ratings[row]),
+                    float(sim_sums[row]),
+                    explanation,
                 )
+            )
+        print(f"Вычислены рекомендации для виртуального пользователя {user_id}")
+        self.recommendation_cache.put(user_id, version, n, predictions)
         return predictions
 
     def get_virtual_user_ratings(self, user_id: int) -> dict:
@@ -138,6 +242,7 @@ class VirtualUserRecommender:
         :param int user_id: ID пользователя
         :return dict: словарь оценок
         """
+        self.load_virtual_user(user_id)
         if user_id in self.virtual_users:
             return self.virtual_users[user_id]
         else:
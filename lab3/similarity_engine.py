@@ -0,0 +1,138 @@
+import numpy as np
+from scipy import sparse
+
+
+class SimilarityEngine:
+    def __init__(self, movie_ids, rating_movies, rating_users, ratings):
+        """
+        Косинусное сходство фильмов на разреженной матрице фильм x пользователь.
+
+        Как и в cosine_similarity, сходство считается только по общим
+        пользователям: sim(i, j) = sum r_i r_j / sqrt(sum r_i^2 * sum r_j^2),
+        где все суммы — по пользователям, оценившим оба фильма. Если таких
+        пользователей меньше двух, сходство равно 0. Для строк i сразу по всем j
+        это четыре разреженных произведения: R R^T (скалярные произведения),
+        B B^T (число общих пользователей), R^2 B^T и B (R^2)^T (нормы на общих
+        пользователях), где B — матрица индикаторов оценок.
+
+        :param movie_ids: ID всех фильмов каталога (порядок строк)
+        :param rating_movies: ID фильма для каждой оценки
+        :param rating_users: ID пользователя для каждой оценки
+        :param ratings: оценки
+        Оценки фильмов, которых нет в movie_ids, не учитываются.
+        """
+        self.movie_ids = np.asarray(movie_ids)
+        self.movie_index = {movie: i for i, movie in enumerate(self.movie_ids.tolist())}
+        known = np.isin(rating_movies, self.movie_ids)
+        rating_movies = np.asarray(rating_movies)[known]
+        rating_users = np.asarray(rating_users)[known]
+        ratings = np.asarray(ratings)[known]
+        sorter = np.argsort(self.movie_ids, kind="stable")
+        rows = sorter[np.searchsorted(self.movie_ids, rating_movies, sorter=sorter)]
+        _, cols = np.unique(rating_users, return_inverse=True)
+        n_users = int(cols.max()) + 1 if len(cols) else 0
+        shape = (len(self.movie_ids), n_users)
+
+        values = np.asarray(ratings, dtype=np.float64)
+        self.set_matrix(sparse.csr_matrix((values, (rows, cols)), shape=shape))
+
+    @classmethod
+    def from_matrix(
+        cls,
+        movie_ids,
+        matrix: sparse.csr_matrix,
+        squares: sparse.csr_matrix = None,
+        indicators: sparse.csr_matrix = None,
+    ) -> "SimilarityEngine":
+        """
+        Создание движка по готовой CSR-матрице оценок фильм x пользователь
+        (например, открытой в разделяемой памяти)
+
+        :param movie_ids: ID фильмов (строки матрицы)
+        :param sparse.csr_matrix matrix: матрица оценок
+        :param sparse.csr_matrix squares: готовая матрица квадратов оценок
+        :param sparse.csr_matrix indicators: готовая матрица индикаторов оценок
+        :return SimilarityEngine: движок расчета сходства
+        """
+        engine = cls.__new__(cls)
+        engine.movie_ids = np.asarray(movie_ids)
+        engine.movie_index = {
+            movie: i for i, movie in enumerate(engine.movie_ids.tolist())
+        }
+        engine.set_matrix(matrix, squares, indicators)
+        return engine
+
+    def set_matrix(
+        self,
+        matrix: sparse.csr_matrix,
+        squares: sparse.csr_matrix = None,
+        indicators: sparse.csr_matrix = None,
+    ) -> None:
+        """
+        Матрица оценок и производные от нее матрицы квадратов и индикаторов
+        (если они не переданы готовыми, они строятся на тех же indices/indptr)
+        """
+        self.ratings = matrix
+        if squares is None:
+            squares = self.with_data(matrix, matrix.data**2)
+        if indicators is None:
+            indicators = self.with_data(matrix, np.ones_like(matrix.data))
+        self.squares = squares
+        self.indicators = indicators
+
+    @staticmethod
+    def with_data(matrix: sparse.csr_matrix, data: np.ndarray) -> sparse.csr_matrix:
+        """
+        CSR-матрица с той же структурой, что и matrix, и значениями data
+        (массивы indices и indptr не копируются)
+        """
+        return sparse.csr_matrix(
+            (data, matrix.indices, matrix.indptr), shape=matrix.shape, copy=False
+        )
+
+    @property
+    def n_items(self) -> int:
+        """Количество фильмов"""
+        return len(self.movie_ids)
+
+    def similarity_block(self, rows, return_counts: bool = False):
+        """
+        Сходство фильмов из rows со всеми фильмами каталога
+
+        :param rows: номера строк (фильмов) в порядке movie_ids
+        :param bool return_counts: вернуть также число общих пользователей
+        :return np.ndarray: плотная матрица (len(rows), n_items)
+            (и такая же матрица числа общих пользователей при return_counts)
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        dots = (self.ratings[rows] @ self.ratings.T).toarray()
+        counts = (self.indicators[rows] @ self.indicators.T).toarray()
+        norms_left = (self.squares[rows] @ self.indicators.T).toarray()
+        norms_right = (self.indicators[rows] @ self.squares.T).toarray()
+
+        similarity = np.zeros(dots.shape)
+        valid = (counts >= 2) & (norms_left > 0) & (norms_right > 0)
+        similarity[valid] = dots[valid] / (
+            np.sqrt(norms_left[valid]) * np.sqrt(norms_right[valid])
+        )
+        similarity[np.arange(len(rows)), rows] = 1.0
+        if return_counts:
+            return similarity, counts
+        return similarity
+
+    def similarity_row(self, movie_id: int) -> np.ndarray:
+        """
+        Сходство фильма со всеми фильмами каталога
+
+        :param int movie_id: ID фильма
+        :return np.ndarray: сходства в порядке movie_ids
+        """
+        return self.similarity_block([self.movie_index[movie_id]])[0]
+
+    def similarity_matrix(self) -> np.ndarray:
+        """
+        Полная матрица сходства фильмов
+
+        :return np.ndarray: матрица (n_items, n_items) в порядке movie_ids
+        """
+        return self.similarity_block(np.arange(self.n_items))
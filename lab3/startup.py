@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+
+class BackgroundLoader:
+    def __init__(self, phases: list):
+        """
+        Поэтапная загрузка данных и модели в фоне, пока бот уже отвечает.
+
+        Обычные функции этапов выполняются в потоке (loop.run_in_executor),
+        чтобы не блокировать цикл событий, корутины — прямо в цикле событий.
+        Для каждого этапа запоминаются время выполнения и ошибка, если она была;
+        после ошибки следующие этапы не выполняются.
+
+        :param list phases: этапы [(название, функция или корутина), ...]
+        """
+        self.phases = phases
+        self.done = set()
+        self.timings = {}
+        self.current = None
+        self.current_started = None
+        self.error = None
+        self.started = None
+        self.task = None
+
+    def is_ready(self, phase: str = None) -> bool:
+        """
+        Проверка готовности
+
+        :param str phase: название этапа (по умолчанию — все этапы)
+        :return bool: этап (или вся загрузка) завершен
+        """
+        if phase is None:
+            return len(self.done) == len(self.phases)
+        return phase in self.done
+
+    async def run(self) -> None:
+        """Последовательное выполнение этапов"""
+        loop = asyncio.get_running_loop()
+        self.started = time.perf_counter()
+        for name, func in self.phases:
+            self.current = name
+            self.current_started = phase_started = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    await func()
+                else:
+                    await loop.run_in_executor(None, func)
+            except Exception as e:
+                self.error = f"{name}: {e!r}"
+                self.current = None
+                print(f"Ошибка на этапе загрузки {name}: {e!r}")
+                return
+            self.timings[name] = time.perf_counter() - phase_started
+            self.done.add(name)
+            print(f"Этап загрузки {name} завершен за {self.timings[name]:.1f} с")
+        self.current = None
+        print(f"Загрузка завершена за {time.perf_counter() - self.started:.1f} с")
+
+    def start(self) -> asyncio.Task:
+        """
+        Запуск загрузки фоновой задачей в текущем цикле событий
+
+        :return asyncio.Task: задача загрузки
+        """
+        self.task = asyncio.get_running_loop().create_task(self.run())
+        return self.task
+
+    def status(self) -> str:
+        """
+        Текстовое описание состояния загрузки
+
+        :return str: готовность и время этапов
+        """
+        if self.is_ready():
+            lines = ["Модель готова"]
+        elif self.error:
+            lines = ["Модель не загружена"]
+        else:
+            lines = ["Модель загружается"]
+        for name, _ in self.phases:
+            if name in self.done:
+                lines.append(f"- {name}: {self.timings[name]:.1f} с")
+            elif name == self.current:
+                elapsed = time.perf_counter() - self.current_started
+                lines.append(f"- {name}: выполняется ({elapsed:.0f} с)")
+            else:
+                lines.append(f"- {name}: ожидает")
+        if self.error:
+            lines.append(f"Ошибка загрузки: {self.error}")
+        return "\n".join(lines)
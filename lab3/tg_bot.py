@@ -10,13 +10,163 @@ from telebot.types import (
 )
 from dotenv import load_dotenv
 from data_handler import DataHandler
+from model_executor import ModelExecutor
 from recommender import VirtualUserRecommender
+from startup import BackgroundLoader
+from user_store import UserStore
 
 load_dotenv()
 
 bot = AsyncTeleBot(os.getenv("BOT_TOKEN"))
+# USER_STORE_PATH= (пустое значение) — не сохранять виртуальных пользователей
+user_store_path = os.getenv("USER_STORE_PATH", "virtual_users_lab3.sqlite3")
+user_store = UserStore(user_store_path) if user_store_path else None
 data_handler = DataHandler()
-recommender = VirtualUserRecommender(data_handler)
+recommender = VirtualUserRecommender(data_handler, user_store=user_store)
+model_executor = ModelExecutor()
+# оценки, полученные до готовности модели {пользователь: {фильм: оценка}},
+# пользователи, чьи оценки еще не перенесены в модель, и пользователи,
+# сбросившие оценки (/restart) до готовности модели
+fallback_ratings = {}
+fallback_changed = set()
+fallback_resets = set()
+
+
+def load_data() -> None:
+    """Загрузка данных MovieLens без ближайших соседей (этап фоновой загрузки)"""
+    data_handler.load_movielens_data(with_neighbors=False)
+
+
+def apply_fallback_ratings(user_id: int, ratings: dict, reset: bool) -> None:
+    """
+    Перенос в модель оценок пользователя, полученных до ее готовности
+
+    :param int user_id: ID пользователя
+    :param dict ratings: оценки {фильм: оценка}
+    :param bool reset: пользователь сбросил прежние оценки
+    """
+    recommender.load_virtual_user(user_id)
+    if reset or user_id not in recommender.virtual_users:
+        recommender.delete_virtual_user(user_id)
+        recommender.create_virtual_user(user_id)
+    for movie_id, rating in ratings.items():
+        recommender.update_virtual_user(user_id, movie_id, rating)
+
+
+async def sync_fallback_users() -> None:
+    """
+    Перенос в модель оценок, полученных до ее готовности.
+    Пока идет перенос, новые оценки продолжают попадать в fallback_ratings,
+    поэтому перенос повторяется, пока не останется измененных пользователей.
+    """
+    while fallback_changed:
+        users = list(fallback_changed)
+        fallback_changed.clear()
+        for user_id in users:
+            ratings = dict(fallback_ratings[user_id])
+            reset = user_id in fallback_resets
+            fallback_resets.discard(user_id)
+            await model_executor.run(
+                user_id, apply_fallback_ratings, user_id, ratings, reset
+            )
+    fallback_ratings.clear()
+
+
+loader = BackgroundLoader(
+    [
+        ("данные", load_data),
+        ("соседи", data_handler.load_neighbors),
+        ("оценки пользователей", sync_fallback_users),
+    ]
+)
+
+
+def get_user_ratings(user_id: int) -> dict:
+    """
+    Копия оценок виртуального пользователя, которую можно читать вне потока модели
+
+    :param int user_id: ID пользователя
+    :return dict: словарь оценок
+    """
+    return dict(recommender.get_virtual_user_ratings(user_id))
+
+
+def get_stored_ratings(user_id: int) -> dict:
+    """
+    Оценки пользователя, сохраненные в user_store (модель для этого не нужна)
+
+    :param int user_id: ID пользователя
+    :return dict: словарь оценок (пустой, если пользователя нет)
+    """
+    if user_store is None:
+        return {}
+    return user_store.load_user(user_id) or {}
+
+
+async def load_user_ratings(user_id: int) -> dict:
+    """
+    Оценки пользователя: из модели или, пока она загружается, сохраненные
+    в user_store (если пользователь их не сбросил) вместе с fallback_ratings
+
+    :param int user_id: ID пользователя
+    :return dict: словарь оценок
+    """
+    if not loader.is_ready():
+        ratings = {}
+        if user_id not in fallback_resets:
+            ratings = await model_executor.run(user_id, get_stored_ratings, user_id)
+        ratings.update(fallback_ratings.get(user_id, {}))
+        return ratings
+    return await model_executor.run(user_id, get_user_ratings, user_id)
+
+
+async def reset_user(user_id: int) -> None:
+    """
+    Сброс оценок пользователя
+
+    :param int user_id: ID пользователя
+    """
+    if not loader.is_ready():
+        fallback_ratings[user_id] = {}
+        fallback_changed.add(user_id)
+        fallback_resets.add(user_id)
+        return
+    await model_executor.run(user_id, recommender.delete_virtual_user, user_id)
+    await model_executor.run(user_id, recommender.create_virtual_user, user_id)
+
+
+async def rate_movie(user_id: int, movie_id: int, rating: int) -> None:
+    """
+    Сохранение оценки пользователя
+
+    :param int user_id: ID пользователя
+    :param int movie_id: ID фильма
+    :param int rating: оценка
+    """
+    if not loader.is_ready():
+        fallback_ratings.setdefault(user_id, {})[movie_id] = rating
+        fallback_changed.add(user_id)
+        return
+    await model_executor.run(
+        user_id, recommender.update_virtual_user, user_id, movie_id, rating
+    )
+
+
+async def reply_if_loading(chat_id: int) -> bool:
+    """
+    Ответ пользователю, если данные о фильмах еще не загружены
+
+    :param int chat_id: ID чата
+    :return bool: данные не загружены, ответ отправлен
+    """
+    if loader.is_ready("данные"):
+        return False
+    await bot.send_message(
+        chat_id,
+        "Бот еще загружает данные о фильмах, попробуйте через минуту.\n"
+        "Состояние загрузки: /status",
+    )
+    return True
 
 
 def create_main_menu() -> ReplyKeyboardMarkup:
@@ -64,8 +214,9 @@ def create_recommendations_keyboard() -> InlineKeyboardMarkup:
 async def handle_start(message: Message):
     """Обработчик команд /start и /restart"""
     user_id = message.from_user.id
-    recommender.delete_virtual_user(user_id)
-    recommender.create_virtual_user(user_id)
+    if await reply_if_loading(message.chat.id):
+        return
+    await reset_user(user_id)
     await bot.send_message(
         message.chat.id,
         "Это бот для рекомендации фильмов!\n"
@@ -79,7 +230,7 @@ async def handle_start(message: Message):
 async def handle_rate_more(message: Message):
     """Обработчик команды /rate_more"""
     user_id = message.from_user.id
-    user_ratings = recommender.get_virtual_user_ratings(user_id)
+    user_ratings = await load_user_ratings(user_id)
     if not user_ratings:
         await bot.send_message(
             message.chat.id,
@@ -102,6 +253,7 @@ async def handle_help(message: Message):
 /restart - перезапустить бота (сбросить оценки)
 /rate_more - оценить еще фильмы (сохраняя предыдущие оценки)
 /my_ratings - показать все оценки
+/status - состояние загрузки модели
 
 Как использовать:
 1. Оцените несколько (10) популярных фильмов
@@ -111,11 +263,26 @@ async def handle_help(message: Message):
     await bot.send_message(message.chat.id, help_text)
 
 
+@bot.message_handler(commands=["status"])
+async def handle_status(message: Message):
+    """Обработчик команды /status"""
+    status = loader.status()
+    if loader.is_ready():
+        stats = recommender.recommendation_cache.stats()
+        status += (
+            f"\nКэш рекомендаций: попаданий {stats['hits']}, "
+            f"промахов {stats['misses']}, записей {stats['size']}"
+        )
+    await bot.send_message(message.chat.id, status)
+
+
 @bot.message_handler(commands=["my_ratings"])
 async def handle_my_ratings(message: Message):
     """Обработчик команды /my_ratings"""
     user_id = message.from_user.id
-    user_ratings = recommender.get_virtual_user_ratings(user_id)
+    if await reply_if_loading(message.chat.id):
+        return
+    user_ratings = await load_user_ratings(user_id)
     if not user_ratings:
         await bot.send_message(
             message.chat.id,
@@ -126,8 +293,8 @@ async def handle_my_ratings(message: Message):
         return
 
     response = f"Ваши оценки ({len(user_ratings)} фильмов):\n"
-    for movie_id, rating in user_ratings.items():
-        movie_title = data_handler.get_movie_title(movie_id)
+    movie_titles = data_handler.get_movie_titles(user_ratings.keys())
+    for movie_title, rating in zip(movie_titles, user_ratings.values()):
         response += f"- {movie_title}: {rating}\n"
     await bot.send_message(message.chat.id, response)
 
@@ -146,7 +313,13 @@ async def show_movie_for_rating(chat_id: int, user_id: int, iteration: int) -> N
     :param int user_id: ID пользователя
     :param int iteration: номер итерации оценки
     """
-    if iteration == 5:
+    if await reply_if_loading(chat_id):
+        return
+    movie_to_rate = None
+    if iteration < 5:
+        user_ratings = await load_user_ratings(user_id)
+        movie_to_rate = data_handler.get_onboarding_movie(exclude=user_ratings.keys())
+    if movie_to_rate is None:
         await bot.send_message(
             chat_id,
             "Формирую персональные рекомендации...",
@@ -155,13 +328,6 @@ async def show_movie_for_rating(chat_id: int, user_id: int, iteration: int) -> N
         await show_recommendations(chat_id, user_id)
         return
 
-    user_ratings = recommender.get_virtual_user_ratings(user_id)
-    rated_movies = set(user_ratings.keys())
-    movie_to_rate = None
-    while not movie_to_rate:
-        popular_movie = data_handler.get_popular_movie()
-        movie_to_rate = popular_movie if popular_movie not in rated_movies else None
-
     movie_title = data_handler.get_movie_title(movie_to_rate)
     genres = data_handler.get_movie_genres(movie_to_rate)
     genres_str = ", ".join(genres) if genres else "Не указаны"
@@ -184,9 +350,7 @@ async def handle_rating_callback(call: CallbackQuery):
 
     if rating_action != "skip":
         rating = int(rating_action)
-        recommender.update_virtual_user(user_id, movie_id, rating)
-        # пересчитываем сходства для данного фильма относительно всех
-        data_handler.compute_movie_similarity(movie_id)
+        await rate_movie(user_id, movie_id, rating)
     await bot.answer_callback_query(call.id)
     await show_movie_for_rating(chat_id, user_id, iteration + 1)
 
@@ -207,30 +371,83 @@ async def show_recommendations(chat_id: int, user_id: int) -> None:
     :param int chat_id: ID чата
     :param int user_id: ID пользователя
     """
-    recommendations = recommender.recommend_for_virtual_user(user_id, n=5)
+    if await reply_if_loading(chat_id):
+        return
+    if not loader.is_ready():
+        await show_cold_start_movies(
+            chat_id,
+            user_id,
+            "Модель еще загружается, пока вот фильмы, которые высоко оценивают зрители",
+            "Ваши оценки сохранены и будут учтены, когда модель загрузится.",
+        )
+        return
+    recommendations = await model_executor.run(
+        user_id, recommender.recommend_for_virtual_user, user_id, 5, coalesce=True
+    )
     if not recommendations:
-        await bot.send_message(
+        await show_cold_start_movies(
             chat_id,
+            user_id,
             "К сожалению, не удалось найти рекомендации на основе ваших оценок.\n"
+            "Пока вот фильмы, которые высоко оценивают зрители",
             "Попробуйте оценить больше фильмов.",
-            reply_markup=create_main_menu(),
         )
         return
 
     response = f"Персональные рекомендации для вас:\n\n"
-    for i, (movie_id, pred_rating, _) in enumerate(recommendations, 1):
-        movie_title = data_handler.get_movie_title(movie_id)
-        movie_genres = data_handler.get_movie_genres(movie_id)
+    movie_ids = [movie_id for movie_id, _, _, _ in recommendations]
+    movie_titles = data_handler.get_movie_titles(movie_ids)
+    movies_genres = data_handler.get_movie_genres_batch(movie_ids)
+    reason_ids = list(
+        {item["movie_id"] for _, _, _, explanation in recommendations for item in explanation}
+    )
+    reason_titles = dict(zip(reason_ids, data_handler.get_movie_titles(reason_ids)))
+    for i, (movie_title, movie_genres, (_, pred_rating, _, explanation)) in enumerate(
+        zip(movie_titles, movies_genres, recommendations), 1
+    ):
         genres_str = ", ".join(movie_genres) if movie_genres else "Не указаны"
         response += f"{i}. {movie_title}\n"
         response += f"   Предсказанная оценка: {pred_rating:.2f}\n"
-        response += f"   Жанр: {genres_str}\n\n"
+        response += f"   Жанр: {genres_str}\n"
+        if explanation:
+            reasons = ", ".join(
+                f"{reason_titles[item['movie_id']]} ({item['rating']})"
+                for item in explanation
+            )
+            response += f"   Похож на оцененные вами: {reasons}\n"
+        response += "\n"
     response += "---\n"
     response += "Для улучшения рекомендаций оцените еще несколько фильмов."
     keyboard = create_recommendations_keyboard()
     await bot.send_message(chat_id, response, reply_markup=keyboard)
 
 
+async def show_cold_start_movies(
+    chat_id: int, user_id: int, header: str, footer: str
+) -> None:
+    """
+    Показ фильмов из заранее посчитанных подборок вместо персональных рекомендаций
+
+    :param int chat_id: ID чата
+    :param int user_id: ID пользователя
+    :param str header: заголовок сообщения
+    :param str footer: подпись под списком
+    """
+    user_ratings = await load_user_ratings(user_id)
+    movie_ids = data_handler.get_cold_start_movies(user_ratings, 5)
+    response = f"{header}:\n\n"
+    movie_titles = data_handler.get_movie_titles(movie_ids)
+    movies_genres = data_handler.get_movie_genres_batch(movie_ids)
+    for i, (movie_title, movie_genres) in enumerate(zip(movie_titles, movies_genres), 1):
+        genres_str = ", ".join(movie_genres) if movie_genres else "Не указаны"
+        response += f"{i}. {movie_title}\n"
+        response += f"   Жанр: {genres_str}\n\n"
+    response += "---\n"
+    response += footer
+    keyboard = create_recommendations_keyboard()
+    await bot.send_message(chat_id, response, reply_markup=keyboard)
+
+
 @bot.message_handler(func=lambda message: True)
 async def handle_other_messages(message: Message):
     """Обработчик других сообщений"""
@@ -242,6 +459,18 @@ async def handle_other_messages(message: Message):
 
 
 async def start_bot():
-    data_handler.load_movielens_data()
+    """
+    Запуск бота. По умолчанию данные и модель загружаются в фоне, а бот сразу
+    начинает отвечать (до готовности модели — популярными фильмами);
+    LAZY_STARTUP=0 — загрузка до начала опроса.
+    """
+    if os.getenv("LAZY_STARTUP", "1") == "0":
+        await loader.run()
+    else:
+        loader.start()
     print("Бот запущен")
-    await bot.polling()
+    try:
+        await bot.polling()
+    finally:
+        if user_store is not None:
+            user_store.close()
@@ -0,0 +1,152 @@
+import queue
+import sqlite3
+import threading
+import time
+
+
+class UserStore:
+    def __init__(self, path: str, batch_size: int = 256, flush_interval: float = 0.5):
+        """
+        Хранилище оценок виртуальных пользователей в SQLite (режим WAL).
+
+        Изменения записываются отложенно: create_user / set_rating / delete_user
+        только кладут операцию в очередь и сразу возвращаются, а фоновый поток
+        забирает операции пакетами (до batch_size операций или пока не пройдет
+        flush_interval секунд) и записывает каждый пакет одной транзакцией.
+        load_user сначала дожидается записи очереди, поэтому видит все изменения.
+
+        :param str path: путь к файлу базы данных
+        :param int batch_size: максимальное количество операций в транзакции
+        :param float flush_interval: максимальная задержка записи операции, с
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY);
+                CREATE TABLE IF NOT EXISTS ratings (
+                    user_id INTEGER NOT NULL,
+                    movie_id INTEGER NOT NULL,
+                    rating INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, movie_id)
+                );
+                """
+            )
+            self.connection.commit()
+        self.writer = threading.Thread(
+            target=self._write_loop, name="user-store", daemon=True
+        )
+        self.writer.start()
+
+    def create_user(self, user_id: int) -> None:
+        """
+        Создание пользователя без оценок (существующие оценки удаляются)
+
+        :param int user_id: ID пользователя
+        """
+        self.queue.put(("create", user_id))
+
+    def set_rating(self, user_id: int, movie_id: int, rating: int) -> None:
+        """
+        Добавление или изменение оценки пользователя
+
+        :param int user_id: ID пользователя
+        :param int movie_id: ID фильма
+        :param int rating: оценка
+        """
+        self.queue.put(("rate", user_id, movie_id, rating))
+
+    def delete_user(self, user_id: int) -> None:
+        """
+        Удаление пользователя и его оценок
+
+        :param int user_id: ID пользователя
+        """
+        self.queue.put(("delete", user_id))
+
+    def load_user(self, user_id: int):
+        """
+        Загрузка оценок пользователя
+
+        :param int user_id: ID пользователя
+        :return dict | None: оценки {фильм: оценка} или None, если пользователя нет
+        """
+        self.flush()
+        with self.lock:
+            found = self.connection.execute(
+                "SELECT 1 FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if found is None:
+                return None
+            rows = self.connection.execute(
+                "SELECT movie_id, rating FROM ratings WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def flush(self) -> None:
+        """Ожидание записи всех операций из очереди"""
+        self.queue.put(("flush",))
+        self.queue.join()
+
+    def close(self) -> None:
+        """Запись оставшихся операций и закрытие базы данных"""
+        self.queue.put(("stop",))
+        self.writer.join()
+        with self.lock:
+            self.connection.close()
+
+    def _write_loop(self) -> None:
+        """Фоновая запись операций пакетами"""
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1][0] not in ("flush", "stop") and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            stop = batch[-1][0] == "stop"
+            try:
+                self._write(batch)
+            except sqlite3.Error as e:
+                print(f"Не удалось сохранить изменения пользователей: {e}")
+            for _ in batch:
+                self.queue.task_done()
+
+    def _write(self, batch: list) -> None:
+        """
+        Запись пакета операций одной транзакцией
+
+        :param list batch: операции
+        """
+        with self.lock, self.connection:
+            for operation in batch:
+                kind, args = operation[0], operation[1:]
+                if kind == "create":
+                    self.connection.execute("DELETE FROM ratings WHERE user_id = ?", args)
+                    self.connection.execute(
+                        "INSERT OR IGNORE INTO users (user_id) VALUES (?)", args
+                    )
+                elif kind == "rate":
+                    self.connection.execute(
+                        "INSERT OR IGNORE INTO users (user_id) VALUES (?)", args[:1]
+                    )
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO ratings (user_id, movie_id, rating) "
+                        "VALUES (?, ?, ?)",
+                        args,
+                    )
+                elif kind == "delete":
+                    self.connection.execute("DELETE FROM ratings WHERE user_id = ?", args)
+                    self.connection.execute("DELETE FROM users WHERE user_id = ?", args)
@@ -0,0 +1,116 @@
+import numpy as np
+from sgd import compute_implied_vectors
+
+
+def solve_least_squares(
+    row_idx: np.ndarray,
+    fixed_vectors: np.ndarray,
+    targets: np.ndarray,
+    n_rows: int,
+    reg: float,
+) -> np.ndarray:
+    """
+    Пакетное решение независимых задач гребневой регрессии, по одной на строку:
+    x_r = argmin sum (t - x_r v)^2 + reg * n_r * |x_r|^2 по всем оценкам строки r.
+    Строки группируются по числу оценок (границы — степени двойки), оценки каждой
+    группы укладываются в дополненный нулями тензор, и матрицы X^T X считаются
+    одним пакетным np.matmul. Затем все системы решаются одним вызовом np.linalg.solve.
+
+    :param np.ndarray row_idx: индекс строки для каждой оценки
+    :param np.ndarray fixed_vectors: фиксированный вектор признаков для каждой оценки
+    :param np.ndarray targets: целевое значение для каждой оценки
+    :param int n_rows: количество строк
+    :param float reg: коэффициент регуляризации (умножается на число оценок строки)
+    :return np.ndarray: решения (n_rows, размерность вектора)
+    """
+    dim = fixed_vectors.shape[1]
+    order = np.argsort(row_idx, kind="stable")
+    counts = np.bincount(row_idx, minlength=n_rows)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    gram = np.zeros((n_rows, dim, dim))
+    rhs = np.zeros((n_rows, dim))
+
+    buckets = np.ceil(np.log2(np.maximum(counts, 1))).astype(int)
+    for bucket in np.unique(buckets[counts > 0]):
+        rows = np.flatnonzero((buckets == bucket) & (counts > 0))
+        width = 1 << bucket
+        offsets = np.arange(width)
+        valid = offsets < counts[rows, None]
+        positions = order[(starts[rows, None] + np.minimum(offsets, counts[rows, None] - 1))]
+        vectors = fixed_vectors[positions] * valid[:, :, None]
+        gram[rows] = np.matmul(vectors.transpose(0, 2, 1), vectors)
+        rhs[rows] = np.matmul(
+            vectors.transpose(0, 2, 1), (targets[positions] * valid)[:, :, None]
+        )[:, :, 0]
+
+    gram += (reg * np.maximum(counts, 1))[:, None, None] * np.eye(dim)
+    return np.linalg.solve(gram, rhs[:, :, None])[:, :, 0]
+
+
+def als_sweep(
+    user_idx: np.ndarray,
+    item_idx: np.ndarray,
+    ratings: np.ndarray,
+    user_factors: np.ndarray,
+    user_biases: np.ndarray,
+    item_factors: np.ndarray,
+    item_biases: np.ndarray,
+    global_mean: float,
+    reg: float,
+    implicit_factors: np.ndarray = None,
+) -> float:
+    """
+    Одна итерация ALS: решение для [p_u, b_u] при фиксированных фильмах,
+    затем для [q_i, b_i] при фиксированных пользователях.
+    Неявные векторы пользователей на каждом полушаге считаются константами.
+
+    :param np.ndarray user_idx: индексы пользователей (COO)
+    :param np.ndarray item_idx: индексы фильмов (COO)
+    :param np.ndarray ratings: оценки (COO)
+    :param np.ndarray user_factors: матрица факторов пользователей (изменяется на месте)
+    :param np.ndarray user_biases: смещения пользователей (изменяются на месте)
+    :param np.ndarray item_factors: матрица факторов фильмов (изменяется на месте)
+    :param np.ndarray item_biases: смещения фильмов (изменяются на месте)
+    :param float global_mean: средняя оценка
+    :param float reg: параметр регуляризации
+    :param np.ndarray implicit_factors: матрица неявных факторов y_j (не обучается)
+    :return float: сумма квадратов ошибок после итерации
+    """
+    num_users, num_items = len(user_biases), len(item_biases)
+    ones = np.ones((len(ratings), 1))
+
+    implied = compute_implied_vectors(
+        user_idx, item_idx, item_factors, num_users, implicit_factors
+    )
+    q = item_factors[item_idx]
+    targets = (
+        ratings
+        - global_mean
+        - item_biases[item_idx]
+        - np.einsum("ij,ij->i", implied[user_idx], q)
+    )
+    solution = solve_least_squares(
+        user_idx, np.hstack([q, ones]), targets, num_users, reg
+    )
+    user_factors[:] = solution[:, :-1]
+    user_biases[:] = solution[:, -1]
+
+    user_vectors = (user_factors + implied)[user_idx]
+    targets = ratings - global_mean - user_biases[user_idx]
+    solution = solve_least_squares(
+        item_idx, np.hstack([user_vectors, ones]), targets, num_items, reg
+    )
+    item_factors[:] = solution[:, :-1]
+    item_biases[:] = solution[:, -1]
+
+    implied = compute_implied_vectors(
+        user_idx, item_idx, item_factors, num_users, implicit_factors
+    )
+    predictions = (
+        global_mean
+        + user_biases[user_idx]
+        + item_biases[item_idx]
+        + np.einsum("ij,ij->i", (user_factors + implied)[user_idx], item_factors[item_idx])
+    )
+    errors = ratings - predictions
+    return float(errors @ errors)
@@ -1,30 +1,100 @@
 import os
 import pandas as pd
-import random
 import numpy as np
 from dotenv import load_dotenv
+from data_cache import load_cache, save_cache
+from popularity_sampler import PopularitySampler
+from popularity_slates import PopularitySlates
 
 load_dotenv()
 
+GENRES = [
+    "Action",
+    "Adventure",
+    "Animation",
+    "Children",
+    "Comedy",
+    "Crime",
+    "Documentary",
+    "Drama",
+    "Fantasy",
+    "Film-Noir",
+    "Horror",
+    "Musical",
+    "Mystery",
+    "Romance",
+    "Sci-Fi",
+    "Thriller",
+    "War",
+    "Western",
+]
+
 
 class DataHandler:
-    def __init__(self):
+    def __init__(self, load: bool = True):
+        """
+        :param bool load: сразу загрузить данные (иначе — вызвать load_movielens_data позже)
+        """
         self.ratings = None
         self.movies = None
         self.movie_ratings_cnt = None
         self.user_ratings = None
+        self.user_ids = None
+        self.user_offsets = None
+        self.user_items = None
+        self.user_item_ratings = None
+        self.movie_ids = None
+        self.movie_counts = None
+        self.popularity_sampler = None
+        self.movie_rows = None
+        self.movie_titles = None
+        self.movie_genre_masks = None
+        self.slates = None
+        self.sources = None
 
-        self.load_movielens_data()
+        if load:
+            self.load_movielens_data()
 
     def load_movielens_data(self) -> None:
-        """Загрузка данных MovieLens 100K"""
+        """
+        Загрузка данных MovieLens 100K.
+        Разобранные таблицы и производные массивы кэшируются в DATA_CACHE_DIR/lab4
+        (по умолчанию cache/ внутри DATA_DIR) и при следующих запусках
+        отображаются в память, пока не изменятся исходные файлы.
+        """
         data_dir = os.getenv("DATA_DIR")
+        cache_dir = os.path.join(os.getenv("DATA_CACHE_DIR") or f"{data_dir}cache/", "lab4")
+        sources = [f"{data_dir}u.data", f"{data_dir}u.item"]
+        self.sources = sources
+        cached = load_cache(cache_dir, sources)
+        if cached is not None:
+            frames, arrays = cached
+            self.ratings = frames["ratings"]
+            self.movies = frames["movies"]
+            for name, array in arrays.items():
+                setattr(self, name, array)
+            self.movie_ratings_cnt = dict(
+                zip(self.movie_ids.tolist(), self.movie_counts.tolist())
+            )
+            self.popularity_sampler = PopularitySampler(self.movie_ids, self.movie_counts)
+            print(f"Загружено {len(self.ratings)} оценок (из кэша)")
+            print(f"Фильмов в базе: {len(self.movies)}")
+            self.build_movie_index()
+            self.build_slates()
+            return
+
         try:
             self.ratings = pd.read_csv(
                 f"{data_dir}u.data",
                 sep="\t",
                 header=None,
                 names=["user_id", "item_id", "rating", "timestamp"],
+                dtype={
+                    "user_id": np.int32,
+                    "item_id": np.int32,
+                    "rating": np.int8,
+                    "timestamp": np.int32,
+                },
             )
             self.movies = pd.read_csv(
                 f"{data_dir}u.item",
@@ -62,6 +132,21 @@ class DataHandler:
             print(f"Фильмов в базе: {len(self.movies)}")
             self.compute_user_ratings()
             self.compute_movie_ratings_cnt()
+            self.build_movie_index()
+            self.build_slates()
+            save_cache(
+                cache_dir,
+                sources,
+                {"ratings": self.ratings, "movies": self.movies},
+                {
+                    "user_ids": self.user_ids,
+                    "user_offsets": self.user_offsets,
+                    "user_items": self.user_items,
+                    "user_item_ratings": self.user_item_ratings,
+                    "movie_ids": self.movie_ids,
+                    "movie_counts": self.movie_counts,
+                },
+            )
 
         except FileNotFoundError:
             print("Файлы данных не найдены")
@@ -70,37 +155,136 @@ class DataHandler:
             )
 
     def compute_user_ratings(self) -> None:
-        """Создание словаря оценок пользователей"""
+        """
+        Группировка оценок по пользователям в массивы:
+        оценки пользователя user_ids[k] лежат в user_items / user_item_ratings
+        на отрезке user_offsets[k]:user_offsets[k + 1]
+        """
         print("Вычисление оценок...")
-        self.user_ratings = {}
-        for _, row in self.ratings.iterrows():
-            user, movie, rating = row["user_id"], row["item_id"], row["rating"]
-            if user not in self.user_ratings:
-                self.user_ratings[user] = {}
-            self.user_ratings[user][movie] = rating
+        users = self.ratings["user_id"].to_numpy()
+        order = np.argsort(users, kind="stable")
+        self.user_ids, starts = np.unique(users[order], return_index=True)
+        self.user_offsets = np.append(starts, len(order)).astype(np.int64)
+        self.user_items = self.ratings["item_id"].to_numpy()[order]
+        self.user_item_ratings = self.ratings["rating"].to_numpy()[order]
+        self.user_ratings = None
 
     def compute_movie_ratings_cnt(self) -> None:
         """Вычисление числа оценок для каждого фильма"""
-        self.movie_ratings_cnt = {}
-        for _, row in self.ratings.iterrows():
-            movie = row["item_id"]
-            if movie not in self.movie_ratings_cnt:
-                self.movie_ratings_cnt[movie] = 0
-            self.movie_ratings_cnt[movie] += 1
-
-        for _, row in self.movies.iterrows():
-            movie = row["item_id"]
-            if movie not in self.movie_ratings_cnt:
-                self.movie_ratings_cnt[movie] = 0
+        all_movies = pd.Index(self.movies["item_id"]).union(
+            pd.Index(self.ratings["item_id"].unique())
+        )
+        counts = (
+            self.ratings["item_id"].value_counts().reindex(all_movies, fill_value=0)
+        )
+        self.movie_ids = all_movies.to_numpy(dtype=np.int32)
+        self.movie_counts = counts.to_numpy(dtype=np.int64)
+        self.movie_ratings_cnt = dict(
+            zip(self.movie_ids.tolist(), self.movie_counts.tolist())
+        )
+        self.popularity_sampler = PopularitySampler(self.movie_ids, self.movie_counts)
 
     def get_user_ratings(self) -> dict:
         """
-        Получение словаря оценок
+        Получение словаря оценок (строится при первом обращении)
 
         :return dict: словарь оценок пользователей
         """
+        if self.user_ratings is None:
+            items = self.user_items.tolist()
+            ratings = self.user_item_ratings.tolist()
+            offsets = self.user_offsets.tolist()
+            self.user_ratings = {
+                user: dict(zip(items[start:end], ratings[start:end]))
+                for user, start, end in zip(
+                    self.user_ids.tolist(), offsets[:-1], offsets[1:]
+                )
+            }
         return self.user_ratings
 
+    def get_ratings_coo(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Получение всех оценок в виде плоских массивов
+
+        :return tuple[np.ndarray, np.ndarray, np.ndarray]: ID пользователей, ID фильмов, оценки
+        """
+        return (
+            self.ratings["user_id"].to_numpy(),
+            self.ratings["item_id"].to_numpy(),
+            self.ratings["rating"].to_numpy(),
+        )
+
+    def build_movie_index(self) -> None:
+        """
+        Построение индекса фильмов: movie_rows[item_id] — номер строки в movies
+        (-1, если фильма нет), названия — списком, жанры — битовой маской uint32
+        (бит i соответствует GENRES[i])
+        """
+        item_ids = self.movies["item_id"].to_numpy()
+        self.movie_rows = np.full(item_ids.max() + 1, -1, dtype=np.int32)
+        self.movie_rows[item_ids] = np.arange(len(item_ids), dtype=np.int32)
+        self.movie_titles = self.movies["title"].tolist()
+        flags = self.movies[GENRES].to_numpy() == 1
+        bits = np.left_shift(np.uint32(1), np.arange(len(GENRES), dtype=np.uint32))
+        self.movie_genre_masks = (flags * bits).sum(axis=1).astype(np.uint32)
+
+    def build_slates(self) -> None:
+        """
+        Построение подборок популярных и высоко оцененных фильмов (в целом и по жанрам)
+        по числу и сумме оценок фильмов
+        """
+        columns = np.searchsorted(self.movie_ids, self.ratings["item_id"].to_numpy())
+        sums = np.bincount(
+            columns,
+            weights=self.ratings["rating"].to_numpy(),
+            minlength=len(self.movie_ids),
+        )
+        rows = self.get_movie_rows(self.movie_ids)
+        masks = np.where(rows >= 0, self.movie_genre_masks[rows], 0)
+        self.slates = PopularitySlates(
+            self.movie_ids, self.movie_counts, sums, masks, len(GENRES)
+        )
+
+    def get_movie_rows(self, movie_ids) -> np.ndarray:
+        """
+        Номера строк фильмов в таблице movies
+
+        :param movie_ids: ID фильмов
+        :return np.ndarray: номера строк (-1 для неизвестных ID)
+        """
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        known = (movie_ids >= 0) & (movie_ids < len(self.movie_rows))
+        rows = np.full(len(movie_ids), -1, dtype=np.int32)
+        rows[known] = self.movie_rows[movie_ids[known]]
+        return rows
+
+    def get_movie_titles(self, movie_ids) -> list:
+        """
+        Получение названий нескольких фильмов
+
+        :param movie_ids: ID фильмов
+        :return list: названия фильмов
+        """
+        movie_ids = list(movie_ids)
+        return [
+            self.movie_titles[row] if row >= 0 else f"Фильм {movie_id}"
+            for movie_id, row in zip(movie_ids, self.get_movie_rows(movie_ids).tolist())
+        ]
+
+    def get_movie_genres_batch(self, movie_ids) -> list:
+        """
+        Получение жанров нескольких фильмов
+
+        :param movie_ids: ID фильмов
+        :return list: списки жанров
+        """
+        rows = self.get_movie_rows(list(movie_ids))
+        masks = np.where(rows >= 0, self.movie_genre_masks[rows], 0).tolist()
+        return [
+            [genre for i, genre in enumerate(GENRES) if mask >> i & 1]
+            for mask in masks
+        ]
+
     def get_movie_title(self, movie_id: int) -> str:
         """
         Получение названия фильма по ID
@@ -108,10 +292,7 @@ class DataHandler:
         :param int movie_id: ID фильма
         :return str: название фильма
         """
-        movie_info = self.movies[self.movies["item_id"] == movie_id]
-        if len(movie_info) > 0:
-            return movie_info["title"].values[0]
-        return f"Фильм {movie_id}"
+        return self.get_movie_titles([movie_id])[0]
 
     def get_movie_genres(self, movie_id: int) -> list:
         """
@@ -120,32 +301,7 @@ class DataHandler:
         :param int movie_id: ID фильма
         :return list: список жанров
         """
-        genre_columns = [
-            "Action",
-            "Adventure",
-            "Animation",
-            "Children",
-            "Comedy",
-            "Crime",
-            "Documentary",
-            "Drama",
-            "Fantasy",
-            "Film-Noir",
-            "Horror",
-            "Musical",
-            "Mystery",
-            "Romance",
-            "Sci-Fi",
-            "Thriller",
-            "War",
-            "Western",
-        ]
-        movie_info = self.movies[self.movies["item_id"] == movie_id]
-        genres = []
-        for genre in genre_columns:
-            if movie_info[genre].values[0] == 1:
-                genres.append(genre)
-        return genres
+        return self.get_movie_genres_batch([movie_id])[0]
 
     def get_movies_data(self) -> list:
         """
@@ -155,17 +311,54 @@ class DataHandler:
         """
         return self.movies["item_id"].tolist()
 
-    def get_popular_movie(self) -> str:
+    def get_popular_movie(self, exclude=()) -> int:
         """
         Получение популярного фильма. Предпочтение отдается фильмам с наибольшим числом оценок
 
-        :return str: популярный фильм
+        :param exclude: ID фильмов, которые не нужно предлагать (например, уже оцененные)
+        :return int: ID популярного фильма или None, если все фильмы исключены
         """
-        all_movies = []
-        weights = []
-        for movie, cnt in self.movie_ratings_cnt.items():
-            all_movies.append(movie)
-            weights.append(cnt**2 + 1)
+        movies = self.popularity_sampler.sample(1, exclude)
+        return movies[0] if movies else None
 
-        popular_movies = random.choices(all_movies, weights=weights, k=1)
-        return popular_movies[0]
\ No newline at end of file
+    def get_onboarding_movie(self, exclude=()) -> int:
+        """
+        Получение фильма для оценки из подборки самых популярных фильмов,
+        а если она исчерпана — случайного популярного фильма
+
+        :param exclude: ID фильмов, которые не нужно предлагать (например, уже оцененные)
+        :return int: ID фильма или None, если все фильмы исключены
+        """
+        movies = PopularitySlates.take([self.slates.popular[None]], 1, exclude)
+        return movies[0] if movies else self.get_popular_movie(exclude)
+
+    def get_cold_start_movies(self, user_ratings: dict, k: int) -> list:
+        """
+        Рекомендации без модели: высоко оцененные фильмы из подборок жанров,
+        которые пользователь оценил выше всего, затем из общей подборки
+
+        :param dict user_ratings: оценки пользователя {фильм: оценка}
+        :param int k: количество фильмов
+        :return list: ID фильмов
+        """
+        liked = [movie for movie, rating in user_ratings.items() if rating >= 4]
+        rows = self.get_movie_rows(liked or list(user_ratings))
+        masks = self.movie_genre_masks[rows[rows >= 0]]
+        genre_counts = [int(((masks >> i) & 1).sum()) for i in range(len(GENRES))]
+        genres = [
+            genre
+            for genre in np.argsort(genre_counts, kind="stable")[::-1][:3].tolist()
+            if genre_counts[genre] > 0
+        ]
+        slates = [self.slates.top[genre] for genre in genres] + [self.slates.top[None]]
+        return PopularitySlates.take(slates, k, exclude=user_ratings.keys())
+
+    def get_popular_movies(self, k: int, exclude=()) -> list:
+        """
+        Получение k различных популярных фильмов
+
+        :param int k: количество фильмов
+        :param exclude: ID фильмов, которые не нужно предлагать
+        :return list: ID фильмов
+        """
+        return self.popularity_sampler.sample(k, exclude)
@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class FactorStore:
+    def __init__(self, n_factors: int, initial_capacity: int = 16):
+        """
+        Хранилище факторов и смещений виртуальных пользователей.
+
+        Емкость удваивается при заполнении, поэтому добавление пользователя
+        стоит O(1) амортизированно. Строки удаленных пользователей попадают
+        в список свободных и переиспользуются.
+
+        :param int n_factors: количество латентных факторов
+        :param int initial_capacity: начальная емкость
+        """
+        self.n_factors = n_factors
+        self.factors = np.zeros((initial_capacity, n_factors))
+        self.biases = np.zeros(initial_capacity)
+        self.size = 0
+        self.free_slots = []
+
+    @property
+    def capacity(self) -> int:
+        """Количество выделенных строк"""
+        return len(self.biases)
+
+    @property
+    def n_active(self) -> int:
+        """Количество занятых строк"""
+        return self.size - len(self.free_slots)
+
+    def allocate(self) -> int:
+        """
+        Выделение обнуленной строки
+
+        :return int: номер строки
+        """
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            if self.size == self.capacity:
+                self._grow(max(1, 2 * self.capacity))
+            slot = self.size
+            self.size += 1
+        self.factors[slot] = 0.0
+        self.biases[slot] = 0.0
+        return slot
+
+    def release(self, slot: int) -> None:
+        """
+        Освобождение строки для повторного использования
+
+        :param int slot: номер строки
+        """
+        self.free_slots.append(slot)
+
+    def _grow(self, capacity: int) -> None:
+        """Перенос данных в массивы большей емкости"""
+        factors = np.zeros((capacity, self.n_factors))
+        biases = np.zeros(capacity)
+        factors[: self.size] = self.factors[: self.size]
+        biases[: self.size] = self.biases[: self.size]
+        self.factors = factors
+        self.biases = biases
@@ -0,0 +1,55 @@
+import numpy as np
+
+
+class FoldInState:
+    def __init__(self, n_factors: int, reg: float):
+        """
+        Состояние гребневой регрессии для вектора виртуального пользователя x = [p_u, b_u]
+        при фиксированных факторах фильмов.
+
+        Хранит X^T X и X^T t (строки X — [q_i, 1], t = r - mu - b_i), а также обратную
+        матрицу (X^T X + reg * I)^-1, которая обновляется формулой Шермана–Моррисона
+        за O(k^2) при каждой новой оценке.
+
+        :param int n_factors: количество латентных факторов
+        :param float reg: коэффициент гребневой регуляризации
+        """
+        self.n_factors = n_factors
+        self.gram = np.zeros((n_factors + 1, n_factors + 1))
+        self.target = np.zeros(n_factors + 1)
+        self.inverse = np.eye(n_factors + 1) / reg
+
+    def add(self, item_vector: np.ndarray, residual: float, sign: float = 1.0) -> None:
+        """
+        Учет (или исключение при sign=-1) одной оценки
+
+        :param np.ndarray item_vector: факторы фильма q_i
+        :param float residual: r - mu - b_i
+        :param float sign: 1 — добавить оценку, -1 — убрать
+        """
+        x = np.append(item_vector, 1.0)
+        self.gram += sign * np.outer(x, x)
+        self.target += sign * residual * x
+        inverse_x = self.inverse @ x
+        self.inverse -= sign * np.outer(inverse_x, inverse_x) / (1.0 + sign * x @ inverse_x)
+
+    def remove(self, item_vector: np.ndarray, residual: float) -> None:
+        """
+        Исключение ранее учтенной оценки (например, при повторной оценке фильма)
+
+        :param np.ndarray item_vector: факторы фильма q_i
+        :param float residual: r - mu - b_i, с которым оценка была добавлена
+        """
+        self.add(item_vector, residual, sign=-1.0)
+
+    def solve(self, implied_vector: np.ndarray) -> tuple[np.ndarray, float]:
+        """
+        Решение задачи для текущего вектора неявных предпочтений z:
+        предсказание mu + b_u + b_i + (p_u + z) q_i, поэтому из цели вычитается z q_i
+
+        :param np.ndarray implied_vector: вектор неявных предпочтений пользователя
+        :return tuple[np.ndarray, float]: факторы p_u и смещение b_u
+        """
+        rhs = self.target - self.gram[:, : self.n_factors] @ implied_vector
+        solution = self.inverse @ rhs
+        return solution[:-1], float(solution[-1])
@@ -0,0 +1,97 @@
+import numpy as np
+
+
+class IVFIndex:
+    def __init__(
+        self,
+        item_factors: np.ndarray,
+        item_biases: np.ndarray,
+        n_lists: int = None,
+        n_iter: int = 10,
+        seed: int = 0,
+    ):
+        """
+        Приближенный индекс для поиска по максимальному скалярному произведению (MIPS)
+
+        Фильм представляется вектором x_i = [q_i, b_i], тогда оценка пользователя
+        с точностью до константы равна [u, 1] x_i. Дополнение
+        x~_i = [x_i, sqrt(M^2 - |x_i|^2)] сводит MIPS к поиску ближайшего соседа,
+        векторы x~_i разбиваются k-means на n_lists кластеров (IVF).
+
+        :param np.ndarray item_factors: матрица факторов фильмов
+        :param np.ndarray item_biases: смещения фильмов
+        :param int n_lists: количество кластеров (по умолчанию ~sqrt(числа фильмов))
+        :param int n_iter: количество итераций k-means
+        :param int seed: зерно генератора для инициализации центроидов
+        """
+        self.vectors = np.hstack([item_factors, np.asarray(item_biases)[:, None]])
+        norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        extra = np.sqrt(np.maximum(norms.max() - norms, 0.0))
+        augmented = np.hstack([self.vectors, extra[:, None]])
+
+        n_items = len(augmented)
+        if n_lists is None:
+            n_lists = int(np.sqrt(n_items))
+        n_lists = max(1, min(n_lists, n_items))
+        rng = np.random.default_rng(seed)
+        self.centroids = augmented[rng.choice(n_items, n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignment = self._nearest_centroids(augmented)
+            for c in range(n_lists):
+                members = augmented[assignment == c]
+                if len(members):
+                    self.centroids[c] = members.mean(axis=0)
+        assignment = self._nearest_centroids(augmented)
+
+        self.order = np.argsort(assignment, kind="stable")
+        self.offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=self.offsets[1:])
+
+    def _nearest_centroids(self, points: np.ndarray) -> np.ndarray:
+        """Номер ближайшего центроида для каждой точки"""
+        distances = (
+            np.einsum("ij,ij->i", self.centroids, self.centroids)[None, :]
+            - 2 * points @ self.centroids.T
+        )
+        return np.argmin(distances, axis=1)
+
+    def search(
+        self, user_vector: np.ndarray, n: int, n_probe: int, exclude=()
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Поиск фильмов с наибольшим u q_i + b_i
+
+        Просматриваются n_probe ближайших к запросу кластеров (больше — точнее,
+        но медленнее). Если после исключения кандидатов не хватает, просматриваются
+        следующие кластеры.
+
+        :param np.ndarray user_vector: вектор пользователя u
+        :param int n: количество результатов
+        :param int n_probe: количество просматриваемых кластеров
+        :param exclude: индексы фильмов, которые нужно исключить
+        :return tuple[np.ndarray, np.ndarray]: индексы фильмов и значения u q_i + b_i
+        """
+        query = np.append(user_vector, 1.0)
+        centroid_scores = self.centroids[:, :-1] @ query
+        centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        probe_order = np.argsort(centroid_norms - 2 * centroid_scores)
+        exclude = np.asarray(exclude, dtype=np.int64)
+
+        n_probe = max(1, n_probe)
+        while True:
+            lists = probe_order[:n_probe]
+            candidates = np.concatenate(
+                [self.order[self.offsets[c] : self.offsets[c + 1]] for c in lists]
+            )
+            candidates = candidates[~np.isin(candidates, exclude)]
+            if len(candidates) >= n or n_probe >= len(probe_order):
+                break
+            n_probe *= 2
+
+        scores = self.vectors[candidates] @ query
+        n = min(n, len(candidates))
+        if n == 0:
+            return candidates, scores
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return candidates[top], scores[top]
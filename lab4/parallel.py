@@ -0,0 +1,155 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from sgd import sgd_epoch
+
+# массивы, открытые в процессе-обработчике: имя -> (SharedMemory, np.ndarray)
+_worker_arrays = {}
+_worker_shards = {}
+
+
+def _attach(specs: dict) -> dict:
+    """
+    Подключение к блокам разделяемой памяти по их описанию
+
+    :param dict specs: имя массива -> (имя блока, форма, тип)
+    :return dict: имя массива -> (SharedMemory, np.ndarray)
+    """
+    arrays = {}
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        arrays[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    return arrays
+
+
+def _init_worker(specs: dict) -> None:
+    """Инициализация процесса-обработчика: подключение к общим массивам"""
+    _worker_arrays.update(_attach(specs))
+
+
+def _run_shard(
+    shard: int,
+    n_shards: int,
+    backend: str,
+    global_mean: float,
+    lr: float,
+    reg: float,
+    batch_size: int,
+    seed: int,
+) -> float:
+    """
+    Эпоха SGD по части пользователей (user_idx % n_shards == shard).
+    Факторы пользователей у частей не пересекаются, факторы фильмов
+    обновляются без блокировок (Hogwild).
+
+    :return float: сумма квадратов ошибок по части
+    """
+    arrays = {name: array for name, (_, array) in _worker_arrays.items()}
+    if (shard, n_shards) not in _worker_shards:
+        positions = np.flatnonzero(arrays["user_idx"] % n_shards == shard)
+        _worker_shards[(shard, n_shards)] = (
+            arrays["user_idx"][positions],
+            arrays["item_idx"][positions],
+            arrays["ratings"][positions],
+        )
+    user_idx, item_idx, ratings = _worker_shards[(shard, n_shards)]
+    return sgd_epoch(
+        backend,
+        user_idx,
+        item_idx,
+        ratings,
+        arrays["user_factors"],
+        arrays["user_biases"],
+        arrays["item_factors"],
+        arrays["item_biases"],
+        global_mean,
+        lr,
+        reg,
+        batch_size=batch_size,
+        rng=np.random.default_rng(seed),
+    )
+
+
+class HogwildTrainer:
+    def __init__(
+        self,
+        model,
+        user_idx: np.ndarray,
+        item_idx: np.ndarray,
+        ratings: np.ndarray,
+        n_workers: int,
+    ):
+        """
+        Параллельное обучение SVDppRecommender пулом процессов.
+
+        Оценки и матрицы модели копируются в разделяемую память, каждый процесс
+        обучает свою часть пользователей, обновляя общие факторы на месте.
+        Используется как контекстный менеджер: при выходе результат копируется
+        обратно в модель, а разделяемая память освобождается.
+
+        :param model: обучаемая модель SVDppRecommender
+        :param np.ndarray user_idx: индексы пользователей (COO, отсортированы)
+        :param np.ndarray item_idx: индексы фильмов (COO)
+        :param np.ndarray ratings: оценки (COO)
+        :param int n_workers: количество процессов
+        """
+        self.model = model
+        self.n_workers = n_workers
+        self.inputs = {
+            "user_idx": user_idx,
+            "item_idx": item_idx,
+            "ratings": ratings,
+            "user_factors": model.user_factors,
+            "user_biases": model.user_biases,
+            "item_factors": model.item_factors,
+            "item_biases": model.item_biases,
+        }
+        self.shared = {}
+        self.executor = None
+        self.epoch = 0
+
+    def __enter__(self) -> "HogwildTrainer":
+        specs = {}
+        for name, array in self.inputs.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+            shared[...] = array
+            self.shared[name] = (shm, shared)
+            specs[name] = (shm.name, array.shape, array.dtype)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.n_workers, initializer=_init_worker, initargs=(specs,)
+        )
+        return self
+
+    def run_epoch(self, lr: float) -> float:
+        """
+        Одна эпоха обучения во всех процессах
+
+        :param float lr: скорость обучения
+        :return float: сумма квадратов ошибок за эпоху
+        """
+        self.epoch += 1
+        futures = [
+            self.executor.submit(
+                _run_shard,
+                shard,
+                self.n_workers,
+                self.model.backend,
+                self.model.global_mean,
+                lr,
+                self.model.reg,
+                self.model.batch_size,
+                self.epoch * self.n_workers + shard,
+            )
+            for shard in range(self.n_workers)
+        ]
+        return sum(future.result() for future in futures)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.executor.shutdown()
+        for name in ("user_factors", "user_biases", "item_factors", "item_biases"):
+            self.inputs[name][...] = self.shared[name][1]
+        for shm, _ in self.shared.values():
+            shm.close()
+            shm.unlink()
+        self.shared = {}
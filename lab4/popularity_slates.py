@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class PopularitySlates:
+    def __init__(
+        self,
+        items,
+        counts,
+        sums,
+        genre_masks,
+        n_genres: int,
+        size: int = 100,
+        prior: float = 10.0,
+    ):
+        """
+        Заранее посчитанные подборки фильмов, которые выдаются без участия модели.
+
+        popular — фильмы по убыванию числа оценок (при равенстве — по средней
+        оценке): их скорее всего смотрели, поэтому они предлагаются для оценки.
+        top — фильмы по сглаженной средней оценке (sum + prior * mean) / (count + prior),
+        где mean — средняя оценка по всем фильмам: рекомендации новым пользователям.
+        Для каждого жанра хранятся такие же подборки среди фильмов жанра.
+
+        :param items: ID фильмов
+        :param counts: количество оценок каждого фильма
+        :param sums: сумма оценок каждого фильма
+        :param genre_masks: жанры фильмов битовыми масками (бит i — жанр i)
+        :param int n_genres: количество жанров
+        :param int size: длина каждой подборки
+        :param float prior: вес средней оценки при сглаживании
+        """
+        items = np.asarray(items)
+        counts = np.asarray(counts, dtype=np.float64)
+        sums = np.asarray(sums, dtype=np.float64)
+        genre_masks = np.asarray(genre_masks, dtype=np.uint32)
+        rated = counts > 0
+        mean = sums[rated].sum() / counts[rated].sum() if rated.any() else 0.0
+        means = np.divide(sums, counts, out=np.zeros_like(sums), where=rated)
+        scores = (sums + prior * mean) / (counts + prior)
+
+        # np.lexsort сортирует по последнему ключу, затем по предыдущим
+        popular_order = np.lexsort((-means, -counts))
+        top_order = np.lexsort((-counts, -scores))
+        top_order = top_order[rated[top_order]]
+        self.popular = {None: items[popular_order[:size]]}
+        self.top = {None: items[top_order[:size]]}
+        for genre in range(n_genres):
+            in_genre = (genre_masks >> np.uint32(genre)) & 1 == 1
+            self.popular[genre] = items[popular_order[in_genre[popular_order]][:size]]
+            self.top[genre] = items[top_order[in_genre[top_order]][:size]]
+
+    @staticmethod
+    def take(slates: list, k: int, exclude=()) -> list:
+        """
+        Выбор k различных фильмов из подборок поочередно (по одному из каждой)
+
+        :param list slates: подборки (массивы ID фильмов)
+        :param int k: количество фильмов
+        :param exclude: ID фильмов, которые нельзя выбирать
+        :return list: ID фильмов (меньше k, если подборки закончились)
+        """
+        seen = set(exclude)
+        result = []
+        positions = [0] * len(slates)
+        slates = [slate.tolist() for slate in slates]
+        while len(result) < k:
+            moved = False
+            for i, slate in enumerate(slates):
+                while positions[i] < len(slate) and slate[positions[i]] in seen:
+                    positions[i] += 1
+                if positions[i] == len(slate):
+                    continue
+                moved = True
+                seen.add(slate[positions[i]])
+                result.append(slate[positions[i]])
+                if len(result) == k:
+                    break
+            if not moved:
+                break
+        return result
@@ -0,0 +1,136 @@
+import numpy as np
+
+
+class CSRRatingStore:
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray):
+        """
+        Хранилище оценок в формате CSR (строка — пользователь, столбец — фильм)
+
+        Строки исходных пользователей лежат в неизменяемых массивах indptr/indices/data.
+        Строки виртуальных пользователей добавляются после них через append_row
+        и хранятся отдельно небольшими массивами, чтобы их можно было дополнять
+        и удалять.
+
+        :param np.ndarray indptr: границы строк (n_rows + 1)
+        :param np.ndarray indices: индексы фильмов
+        :param np.ndarray data: оценки
+        """
+        self.indptr = np.asarray(indptr, dtype=np.int32)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.data = np.asarray(data, dtype=np.float32)
+        self.n_base_rows = len(self.indptr) - 1
+        self.extra_rows = {}
+
+    @classmethod
+    def from_coo(
+        cls, rows: np.ndarray, cols: np.ndarray, values: np.ndarray, n_rows: int
+    ) -> "CSRRatingStore":
+        """
+        Построение хранилища из COO-массивов
+
+        :param np.ndarray rows: индексы строк (пользователей)
+        :param np.ndarray cols: индексы столбцов (фильмов)
+        :param np.ndarray values: оценки
+        :param int n_rows: количество строк
+        :return CSRRatingStore: хранилище оценок
+        """
+        order = np.argsort(rows, kind="stable")
+        indptr = np.zeros(n_rows + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+        return cls(indptr, np.asarray(cols)[order], np.asarray(values)[order])
+
+    @property
+    def n_rows(self) -> int:
+        """Количество строк, включая добавленные"""
+        return self.n_base_rows + len(self.extra_rows)
+
+    def has_row(self, row: int) -> bool:
+        """
+        Проверка существования строки
+
+        :param int row: индекс строки
+        :return bool: есть ли строка в хранилище
+        """
+        return 0 <= row < self.n_base_rows or row in self.extra_rows
+
+    @property
+    def nnz(self) -> int:
+        """Количество хранимых оценок"""
+        return len(self.data) + sum(len(cols) for cols, _ in self.extra_rows.values())
+
+    def row(self, row: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Получение оценок одной строки
+
+        :param int row: индекс строки
+        :return tuple[np.ndarray, np.ndarray]: индексы фильмов и оценки
+        """
+        if row < self.n_base_rows:
+            start, end = self.indptr[row], self.indptr[row + 1]
+            return self.indices[start:end], self.data[start:end]
+        return self.extra_rows[row]
+
+    def row_size(self, row: int) -> int:
+        """
+        Количество оценок в строке
+
+        :param int row: индекс строки
+        :return int: количество оценок
+        """
+        if row < self.n_base_rows:
+            return int(self.indptr[row + 1] - self.indptr[row])
+        return len(self.extra_rows[row][0])
+
+    def append_row(self, row: int = None) -> int:
+        """
+        Добавление пустой строки (для виртуального пользователя)
+
+        :param int row: индекс строки; по умолчанию — следующий после последней
+        :return int: индекс новой строки
+        """
+        if row is None:
+            row = max(self.extra_rows, default=self.n_base_rows - 1) + 1
+        self.extra_rows[row] = (
+            np.empty(0, dtype=np.int32),
+            np.empty(0, dtype=np.float32),
+        )
+        return row
+
+    def remove_row(self, row: int) -> None:
+        """
+        Удаление добавленной строки
+
+        :param int row: индекс строки
+        """
+        self.extra_rows.pop(row, None)
+
+    def add(self, row: int, col: int, value: float) -> None:
+        """
+        Добавление или замена оценки в добавленной строке
+
+        :param int row: индекс строки (виртуального пользователя)
+        :param int col: индекс фильма
+        :param float value: оценка
+        """
+        if row < self.n_base_rows:
+            raise ValueError(f"Строка {row} принадлежит исходным данным и не изменяется")
+        cols, values = self.extra_rows[row]
+        existing = np.flatnonzero(cols == col)
+        if len(existing):
+            values[existing[0]] = value
+            return
+        self.extra_rows[row] = (
+            np.append(cols, np.int32(col)),
+            np.append(values, np.float32(value)),
+        )
+
+    def to_coo(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Представление исходных строк в виде COO-массивов, отсортированных по строке
+
+        :return tuple[np.ndarray, np.ndarray, np.ndarray]: строки, столбцы, оценки
+        """
+        rows = np.repeat(
+            np.arange(self.n_base_rows, dtype=np.int32), np.diff(self.indptr)
+        )
+        return rows, self.indices, self.data
@@ -1,32 +1,108 @@
+import json
+import os
 import numpy as np
 import random
 import math
+from als import als_sweep
+from data_cache import source_signature
 from data_handler import DataHandler
+from factor_store import FactorStore
+from fold_in import FoldInState
+from mips_index import IVFIndex
+from rating_store import CSRRatingStore
+from recommendation_cache import RecommendationCache
+from parallel import HogwildTrainer
+from sgd import DEFAULT_BACKEND, resolve_backend, sgd_epoch
 
 
 class SVDppRecommender:
     def __init__(
-        self, data_handler: DataHandler, n_factors=20, n_epochs=25, lr=0.05, reg=0.02
+        self,
+        data_handler: DataHandler,
+        n_factors=20,
+        n_epochs=25,
+        lr=None,
+        reg=None,
+        backend=DEFAULT_BACKEND,
+        batch_size=1024,
+        implicit_mode="shared",
+        fold_in_reg=10.0,
+        reg_implicit=None,
+        n_workers=1,
+        solver="sgd",
+        use_ann=False,
+        n_lists=None,
+        n_probe=8,
+        cache_size=1024,
+        cache_ttl=600.0,
+        user_store=None,
     ):
         """
         Инициализация SVD++
 
         :param n_factors: количество латентных факторов
         :param n_epochs: количество эпох обучения
-        :param lr: скорость обучения
-        :param reg: параметр регуляризации
+        :param lr: скорость обучения (по умолчанию 0.05, для implicit_mode='learned' — 0.01)
+        :param reg: параметр регуляризации (по умолчанию 0.02, для implicit_mode='learned' — 0.05,
+            для solver='als' — 0.1)
+        :param backend: движок обучения: 'numpy' (мини-пакеты) или 'numba' (поэлементный SGD,
+            как в исходном алгоритме); по умолчанию 'numba', если пакет установлен
+        :param batch_size: размер мини-пакета для backend='numpy'
+        :param implicit_mode: 'shared' — неявный вектор как среднее item_factors,
+            'learned' — настоящий SVD++ с отдельными факторами y_j и нормировкой |N(u)|^-1/2
+        :param fold_in_reg: регуляризация при вычислении векторов виртуальных пользователей
+        :param reg_implicit: регуляризация факторов y_j для implicit_mode='learned' (по умолчанию 0.1)
+        :param n_workers: количество процессов для параллельного обучения (Hogwild)
+        :param solver: 'sgd' или 'als' (чередующиеся наименьшие квадраты, n_epochs — число итераций;
+            только для implicit_mode='shared')
+        :param use_ann: использовать приближенный индекс IVFIndex для выбора рекомендаций
+        :param n_lists: количество кластеров индекса (по умолчанию ~sqrt(числа фильмов))
+        :param n_probe: количество просматриваемых кластеров: больше — точнее, но медленнее
+        :param cache_size: максимальное количество сохраненных списков рекомендаций
+        :param cache_ttl: время жизни сохраненных рекомендаций, с
+        :param user_store: хранилище виртуальных пользователей (UserStore) или None
         """
         self.dh = data_handler
         self.n_factors = n_factors
         self.n_epochs = n_epochs
-        self.lr = lr
+        if implicit_mode not in ("shared", "learned"):
+            raise ValueError(
+                f"Неизвестный implicit_mode '{implicit_mode}', доступны: ('shared', 'learned')"
+            )
+        if solver not in ("sgd", "als"):
+            raise ValueError(f"Неизвестный solver '{solver}', доступны: ('sgd', 'als')")
+        if solver == "als" and implicit_mode == "learned":
+            raise ValueError(
+                "solver='als' не обучает факторы y_j, используйте implicit_mode='shared'"
+            )
+        # с шагом 0.05 отдельные y_j переобучаются и SVD++ уступает режиму 'shared',
+        # поэтому у него свои значения по умолчанию; ALS с reg=0.02 переобучается
+        learned = implicit_mode == "learned"
+        self.lr = lr if lr is not None else (0.01 if learned else 0.05)
+        if reg is None:
+            reg = 0.1 if solver == "als" else 0.05 if learned else 0.02
         self.reg = reg
+        self.reg_implicit = reg_implicit if reg_implicit is not None else 0.1
+        self.implicit_mode = implicit_mode
+        self.backend = resolve_backend(backend, learned=implicit_mode == "learned")
+        self.batch_size = batch_size
+        self.fold_in_reg = fold_in_reg
+        self.solver = solver
+        self.n_workers = n_workers
+        self.use_ann = use_ann
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.index = None
+        if self.n_workers > 1 and self.implicit_mode == "learned":
+            print("Для implicit_mode='learned' обучение выполняется в одном процессе")
+            self.n_workers = 1
 
         self.all_items = self.dh.get_movies_data()
-        user_ratings = self.dh.get_user_ratings()
+        rating_user_ids, rating_item_ids, rating_values = self.dh.get_ratings_coo()
+        user_ids, rating_user_idx = np.unique(rating_user_ids, return_inverse=True)
 
         scale = 0.1 / math.sqrt(self.n_factors)
-        self.num_users = len(user_ratings)
+        self.num_users = len(user_ids)
         self.user_factors = np.random.normal(
             scale=scale, size=(self.num_users, self.n_factors)
         )
@@ -36,48 +112,77 @@ class SVDppRecommender:
             scale=scale, size=(self.num_items, self.n_factors)
         )
         self.item_biases = np.zeros(self.num_items)
+        self.implicit_factors = None
+        if self.implicit_mode == "learned":
+            self.implicit_factors = np.random.normal(
+                scale=scale, size=(self.num_items, self.n_factors)
+            )
 
-        all_ratings = []
-        for items in user_ratings.values():
-            all_ratings.extend(items.values())
-        self.global_mean = np.mean(all_ratings) if all_ratings else 0
+        self.global_mean = float(np.mean(rating_values)) if len(rating_values) else 0
 
-        user_ids = list(user_ratings.keys())
-        self.user_to_idx = {uid: i for i, uid in enumerate(user_ids)}
-        self.idx_to_user = {i: uid for i, uid in enumerate(user_ids)}
+        self.user_to_idx = {int(uid): i for i, uid in enumerate(user_ids)}
+        self.idx_to_user = {i: int(uid) for i, uid in enumerate(user_ids)}
         self.item_to_idx = {iid: i for i, iid in enumerate(self.all_items)}
         self.idx_to_item = {i: iid for i, iid in enumerate(self.all_items)}
 
-        self.user_items = {}
-        self.user_ratings = {}
-        for user_id, ratings in user_ratings.items():
-            user_idx = self.user_to_idx[user_id]
-            self.user_items[user_idx] = []
-            self.user_ratings[user_idx] = {}
-            for item_id, rating in ratings.items():
-                item_idx = self.item_to_idx[item_id]
-                self.user_items[user_idx].append(item_idx)
-                self.user_ratings[user_idx][item_idx] = rating
+        item_ids = np.asarray(self.all_items)
+        item_order = np.argsort(item_ids)
+        rating_item_idx = item_order[
+            np.searchsorted(item_ids, rating_item_ids, sorter=item_order)
+        ]
+        self.ratings_store = CSRRatingStore.from_coo(
+            rating_user_idx, rating_item_idx, rating_values, self.num_users
+        )
 
         self.virtual_users = {}
         self.trained_for_user = {}
+        self.fold_in_states = {}
+        self.virtual_factors = FactorStore(self.n_factors)
+        self.ratings_version = 0
+        self.user_versions = {}
+        self.recommendation_cache = RecommendationCache(cache_size, cache_ttl)
+        self.user_store = user_store
+        self.loaded_users = set()
 
         self.train()
 
     def get_user_implied_vector(self, user_idx: int) -> np.ndarray:
         """
         Вычисление вектора неявных предпочтений пользователя
-        (среднее по всем предметам, с которыми взаимодействовал пользователь)
+        (среднее по всем предметам, с которыми взаимодействовал пользователь,
+        или |N(u)|^-1/2 * сумма y_j в режиме implicit_mode='learned')
 
         :param user_idx: индекс пользователя
         :return: вектор неявных предпочтений
         """
-        if user_idx not in self.user_items or not self.user_items[user_idx]:
+        if not self.ratings_store.has_row(user_idx):
+            return np.zeros(self.n_factors)
+        items, _ = self.ratings_store.row(user_idx)
+        if len(items) == 0:
             return np.zeros(self.n_factors)
+        if self.implicit_factors is not None:
+            return self.implicit_factors[items].sum(axis=0) / math.sqrt(len(items))
+        return self.item_factors[items].mean(axis=0)
 
-        items = self.user_items[user_idx]
-        implied_sum = np.sum([self.item_factors[item] for item in items], axis=0)
-        return implied_sum / len(items)
+    def get_user_factors(self, user_idxs) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Получение факторов и смещений пользователей по индексам.
+        Индексы от числа исходных пользователей и выше относятся к виртуальным.
+
+        :param user_idxs: индексы пользователей
+        :return tuple[np.ndarray, np.ndarray]: матрица факторов и вектор смещений
+        """
+        user_idxs = np.asarray(user_idxs)
+        n_base = len(self.user_biases)
+        virtual = user_idxs >= n_base
+        factors = np.empty((len(user_idxs), self.n_factors))
+        biases = np.empty(len(user_idxs))
+        factors[~virtual] = self.user_factors[user_idxs[~virtual]]
+        biases[~virtual] = self.user_biases[user_idxs[~virtual]]
+        slots = user_idxs[virtual] - n_base
+        factors[virtual] = self.virtual_factors.factors[slots]
+        biases[virtual] = self.virtual_factors.biases[slots]
+        return factors, biases
 
     def predict(self, user_id: int, item_id: int) -> float:
         """
@@ -92,80 +197,288 @@ class SVDppRecommender:
 
         user_idx = self.user_to_idx[user_id]
         item_idx = self.item_to_idx[item_id]
-        prediction = (
-            self.global_mean + self.user_biases[user_idx] + self.item_biases[item_idx]
-        )
-        user_vector = self.user_factors[user_idx] + self.get_user_implied_vector(
-            user_idx
-        )
+        user_factors, user_biases = self.get_user_factors([user_idx])
+        prediction = self.global_mean + user_biases[0] + self.item_biases[item_idx]
+        user_vector = user_factors[0] + self.get_user_implied_vector(user_idx)
         prediction += np.dot(user_vector, self.item_factors[item_idx])
         return np.clip(prediction, 1.0, 5.0)
 
     def train(self):
-        """Обучение модели SVD++"""
-        print(f"Обучение модели SVD++ ({self.n_epochs} эпох):")
+        """
+        Обучение модели SVD++, пересчет факторов виртуальных пользователей
+        по новым факторам фильмов (накопленные суммы fold-in построены по старым),
+        перестроение индекса рекомендаций и сброс кэша рекомендаций
+        """
+        self.fit()
+        for user_id in self.virtual_users:
+            self.train_for_user(user_id)
+        self.build_index()
+        self.recommendation_cache.clear()
+
+    def build_index(self) -> None:
+        """Построение приближенного индекса по факторам фильмов (если use_ann)"""
+        if not self.use_ann:
+            self.index = None
+            return
+        self.index = IVFIndex(self.item_factors, self.item_biases, n_lists=self.n_lists)
+        print(f"Построен индекс рекомендаций: {len(self.index.centroids)} кластеров")
+
+    def fit(self):
+        """Обучение факторов модели выбранным решателем"""
+        train_users, train_items, train_ratings = self.ratings_store.to_coo()
+        if self.solver == "als":
+            print(
+                f"Обучение модели SVD++ ({self.n_epochs} итераций, solver=als, "
+                f"reg={self.reg}):"
+            )
+            for sweep in range(self.n_epochs):
+                total_loss = als_sweep(
+                    train_users,
+                    train_items,
+                    train_ratings,
+                    self.user_factors,
+                    self.user_biases,
+                    self.item_factors,
+                    self.item_biases,
+                    self.global_mean,
+                    self.reg,
+                    implicit_factors=self.implicit_factors,
+                )
+                avg_loss = total_loss / len(train_ratings)
+                print(f"  итерация {sweep + 1}/{self.n_epochs}, Loss: {avg_loss:.4f}")
+            return
+
+        print(
+            f"Обучение модели SVD++ ({self.n_epochs} эпох, solver=sgd, backend={self.backend}, "
+            f"implicit_mode={self.implicit_mode}):"
+        )
+        if self.n_workers > 1:
+            print(f"Параллельное обучение: {self.n_workers} процессов")
+            with HogwildTrainer(
+                self, train_users, train_items, train_ratings, self.n_workers
+            ) as trainer:
+                self.run_epochs(trainer.run_epoch, len(train_ratings))
+            return
+
+        rng = np.random.default_rng()
+        self.run_epochs(
+            lambda lr: sgd_epoch(
+                self.backend,
+                train_users,
+                train_items,
+                train_ratings,
+                self.user_factors,
+                self.user_biases,
+                self.item_factors,
+                self.item_biases,
+                self.global_mean,
+                lr,
+                self.reg,
+                batch_size=self.batch_size,
+                rng=rng,
+                implicit_factors=self.implicit_factors,
+                reg_implicit=self.reg_implicit,
+            ),
+            len(train_ratings),
+        )
+
+    def run_epochs(self, run_epoch, n_ratings: int) -> None:
+        """
+        Цикл по эпохам с затуханием скорости обучения и выводом потерь
+
+        :param run_epoch: функция, выполняющая эпоху при заданной lr и возвращающая сумму квадратов ошибок
+        :param int n_ratings: количество оценок
+        """
+        lr = self.lr
         for epoch in range(self.n_epochs):
-            total_loss = 0
-            num = 0
-            for user_idx in range(self.num_users):
-                implied_vector = self.get_user_implied_vector(user_idx)
-                for item_idx, true_rating in self.user_ratings[user_idx].items():
-                    prediction = (
-                        self.global_mean
-                        + self.user_biases[user_idx]
-                        + self.item_biases[item_idx]
-                    )
-                    prediction += np.dot(
-                        self.user_factors[user_idx] + implied_vector,
-                        self.item_factors[item_idx],
-                    )
-
-                    error = true_rating - prediction
-                    total_loss += error**2
-
-                    user_grad = (
-                        error * self.item_factors[item_idx]
-                        - self.reg * self.user_factors[user_idx]
-                    )
-                    item_grad = (
-                        error * (self.user_factors[user_idx] + implied_vector)
-                        - self.reg * self.item_factors[item_idx]
-                    )
-                    user_bias_grad = error - self.reg * self.user_biases[user_idx]
-                    item_bias_grad = error - self.reg * self.item_biases[item_idx]
-
-                    self.user_factors[user_idx] += self.lr * user_grad
-                    self.item_factors[item_idx] += self.lr * item_grad
-                    self.user_biases[user_idx] += self.lr * user_bias_grad
-                    self.item_biases[item_idx] += self.lr * item_bias_grad
-
-                    num += 1
-
-            self.lr *= 0.95
-            avg_loss = total_loss / num
+            total_loss = run_epoch(lr)
+            lr *= 0.95
+            avg_loss = total_loss / n_ratings
             print(f"  эпоха {epoch + 1}/{self.n_epochs}, Loss: {avg_loss:.4f}")
 
+    def save(self, path: str) -> None:
+        """
+        Сохранение обученной модели в директорию: каждая матрица — отдельный .npy,
+        гиперпараметры и ключ исходных файлов данных — meta.json.
+        Виртуальные пользователи не сохраняются.
+
+        :param str path: директория снимка модели
+        """
+        os.makedirs(path, exist_ok=True)
+        n_base = self.ratings_store.n_base_rows
+        arrays = {
+            "user_factors": self.user_factors,
+            "user_biases": self.user_biases,
+            "item_factors": self.item_factors,
+            "item_biases": self.item_biases,
+            "user_ids": np.array([self.idx_to_user[i] for i in range(n_base)]),
+            "item_ids": np.asarray(self.all_items),
+            "ratings_indptr": self.ratings_store.indptr,
+            "ratings_indices": self.ratings_store.indices,
+            "ratings_data": self.ratings_store.data,
+        }
+        if self.implicit_factors is not None:
+            arrays["implicit_factors"] = self.implicit_factors
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(array))
+
+        meta = {
+            "n_factors": self.n_factors,
+            "n_epochs": self.n_epochs,
+            "lr": self.lr,
+            "reg": self.reg,
+            "reg_implicit": self.reg_implicit,
+            "backend": self.backend,
+            "batch_size": self.batch_size,
+            "implicit_mode": self.implicit_mode,
+            "fold_in_reg": self.fold_in_reg,
+            "n_workers": self.n_workers,
+            "solver": self.solver,
+            "use_ann": self.use_ann,
+            "n_lists": self.n_lists,
+            "n_probe": self.n_probe,
+            "global_mean": self.global_mean,
+            "sources": source_signature(self.dh.sources) if self.dh.sources else None,
+        }
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        print(f"Модель сохранена в {path}")
+
+    @staticmethod
+    def snapshot_matches(path: str, data_handler: DataHandler) -> bool:
+        """
+        Проверка, что снимок модели обучен на текущих данных: совпадают ключ
+        исходных файлов (размер и время изменения, как у кэша данных),
+        список фильмов и количество оценок
+
+        :param str path: директория снимка модели
+        :param DataHandler data_handler: обработчик данных
+        :return bool: снимок можно загрузить
+        """
+        try:
+            with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            sources = source_signature(data_handler.sources or [])
+            item_ids = np.load(os.path.join(path, "item_ids.npy"))
+            ratings = np.load(os.path.join(path, "ratings_data.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return False
+        _, _, rating_values = data_handler.get_ratings_coo()
+        if (
+            meta.get("sources") != sources
+            or item_ids.tolist() != data_handler.get_movies_data()
+            or len(ratings) != len(rating_values)
+        ):
+            print(f"Снимок модели в {path} не соответствует текущим данным")
+            return False
+        return True
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        data_handler: DataHandler = None,
+        mmap_mode="c",
+        cache_size=1024,
+        cache_ttl=600.0,
+        user_store=None,
+    ) -> "SVDppRecommender":
+        """
+        Загрузка модели, сохраненной методом save, без обучения.
+        Матрицы открываются через np.load(mmap_mode=...), поэтому несколько процессов
+        разделяют одни и те же страницы памяти, а загрузка занимает миллисекунды.
+        В режиме "c" (копирование при записи) модель можно дообучать: измененные
+        страницы копируются в память процесса, файлы снимка не меняются.
+
+        :param str path: директория снимка модели
+        :param DataHandler data_handler: обработчик данных
+        :param mmap_mode: режим отображения файлов в память (None — читать в память,
+            "r" — только для чтения, без обучения)
+        :param cache_size: максимальное количество сохраненных списков рекомендаций
+        :param cache_ttl: время жизни сохраненных рекомендаций, с
+        :param user_store: хранилище виртуальных пользователей (UserStore) или None
+        :return SVDppRecommender: загруженная модель
+        """
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+
+        def load_array(name, mode=mmap_mode):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+
+        model = cls.__new__(cls)
+        model.dh = data_handler
+        model.n_factors = meta["n_factors"]
+        model.n_epochs = meta["n_epochs"]
+        model.lr = meta["lr"]
+        model.reg = meta["reg"]
+        model.reg_implicit = meta.get("reg_implicit", 0.1)
+        model.implicit_mode = meta["implicit_mode"]
+        model.backend = meta["backend"]
+        model.batch_size = meta["batch_size"]
+        model.fold_in_reg = meta["fold_in_reg"]
+        model.n_workers = meta["n_workers"]
+        model.solver = meta["solver"]
+        model.use_ann = meta["use_ann"]
+        model.n_lists = meta["n_lists"]
+        model.n_probe = meta["n_probe"]
+        model.global_mean = meta["global_mean"]
+
+        model.user_factors = load_array("user_factors")
+        model.user_biases = load_array("user_biases")
+        model.item_factors = load_array("item_factors")
+        model.item_biases = load_array("item_biases")
+        model.implicit_factors = None
+        if model.implicit_mode == "learned":
+            model.implicit_factors = load_array("implicit_factors")
+        model.ratings_store = CSRRatingStore(
+            load_array("ratings_indptr"),
+            load_array("ratings_indices"),
+            load_array("ratings_data"),
+        )
+
+        user_ids = load_array("user_ids", None).tolist()
+        model.all_items = load_array("item_ids", None).tolist()
+        model.num_users = len(user_ids)
+        model.num_items = len(model.all_items)
+        model.user_to_idx = {uid: i for i, uid in enumerate(user_ids)}
+        model.idx_to_user = {i: uid for i, uid in enumerate(user_ids)}
+        model.item_to_idx = {iid: i for i, iid in enumerate(model.all_items)}
+        model.idx_to_item = {i: iid for i, iid in enumerate(model.all_items)}
+
+        model.virtual_users = {}
+        model.trained_for_user = {}
+        model.fold_in_states = {}
+        model.virtual_factors = FactorStore(model.n_factors)
+        model.ratings_version = 0
+        model.user_versions = {}
+        model.recommendation_cache = RecommendationCache(cache_size, cache_ttl)
+        model.user_store = user_store
+        model.loaded_users = set()
+        model.build_index()
+        print(f"Модель загружена из {path}")
+        return model
+
     def create_virtual_user(self, user_id: int) -> None:
         """
         Создание виртуального пользователя
 
         :param int user_id: ID пользователя
         """
+        self.loaded_users.add(user_id)
+        if user_id in self.virtual_users:
+            self.delete_virtual_user(user_id)
         self.virtual_users[user_id] = {}
         self.trained_for_user[user_id] = False
+        self.fold_in_states[user_id] = FoldInState(self.n_factors, self.fold_in_reg)
 
-        new_idx = len(self.idx_to_user)
+        new_idx = len(self.user_biases) + self.virtual_factors.allocate()
+        self.ratings_store.append_row(new_idx)
         self.user_to_idx[user_id] = new_idx
         self.idx_to_user[new_idx] = user_id
-
-        scale = 0.1 / math.sqrt(self.n_factors)
-        new_user_factor = np.random.normal(scale=scale, size=self.n_factors)
-        self.user_factors = np.vstack([self.user_factors, new_user_factor])
-        self.user_biases = np.append(self.user_biases, 0.0)
-
-        self.user_items[new_idx] = []
-        self.user_ratings[new_idx] = {}
         self.num_users += 1
+        self.bump_ratings_version(user_id)
+        if self.user_store is not None:
+            self.user_store.create_user(user_id)
         print(f"Создан виртуальный пользователь {user_id}")
 
     def update_virtual_user(self, user_id: int, item_id: int, rating: int) -> None:
@@ -176,12 +489,22 @@ class SVDppRecommender:
         :param int item_id: ID фильма
         :param int rating: оценка фильма
         """
-        self.virtual_users[user_id][item_id] = rating
-        self.trained_for_user[user_id] = False
+        self.load_virtual_user(user_id)
         user_idx = self.user_to_idx[user_id]
         item_idx = self.item_to_idx[item_id]
-        self.user_items[user_idx].append(item_idx)
-        self.user_ratings[user_idx][item_idx] = rating
+        state = self.fold_in_states[user_id]
+        base = self.global_mean + self.item_biases[item_idx]
+        if item_id in self.virtual_users[user_id]:
+            old_rating = self.virtual_users[user_id][item_id]
+            state.remove(self.item_factors[item_idx], old_rating - base)
+        state.add(self.item_factors[item_idx], rating - base)
+
+        self.virtual_users[user_id][item_id] = rating
+        self.ratings_store.add(user_idx, item_idx, rating)
+        self.apply_fold_in(user_id)
+        self.bump_ratings_version(user_id)
+        if self.user_store is not None:
+            self.user_store.set_rating(user_id, item_id, rating)
         print(
             f"Добавлена оценка {rating} фильма {item_id} для виртуального пользователя {user_id}"
         )
@@ -192,69 +515,178 @@ class SVDppRecommender:
 
         :param int user_id: ID пользователя
         """
+        self.loaded_users.add(user_id)
+        if self.user_store is not None:
+            self.user_store.delete_user(user_id)
         if user_id in self.virtual_users.keys():
             del self.virtual_users[user_id]
+            del self.trained_for_user[user_id]
+            self.fold_in_states.pop(user_id, None)
+            user_idx = self.user_to_idx.pop(user_id)
+            del self.idx_to_user[user_idx]
+            self.ratings_store.remove_row(user_idx)
+            self.virtual_factors.release(user_idx - len(self.user_biases))
+            self.num_users -= 1
+            self.bump_ratings_version(user_id)
+            self.recommendation_cache.invalidate(user_id)
             print(f"Удален виртуальный пользователь {user_id}")
 
-    def train_for_user(self, user_id: int):
+    def load_virtual_user(self, user_id: int) -> None:
         """
-        Дообучение модели только для конкретного пользователя
+        Загрузка пользователя из user_store при первом обращении к нему после запуска
 
         :param user_id: ID пользователя
         """
-        print(f"Дообучение модели для пользователя {user_id}")
-        user_idx = self.user_to_idx[user_id]
-        for _ in range(self.n_epochs):
-            implied_vector = self.get_user_implied_vector(user_idx)
-            for item_idx, true_rating in self.user_ratings[user_idx].items():
-                prediction = (
-                    self.global_mean
-                    + self.user_biases[user_idx]
-                    + self.item_biases[item_idx]
-                )
-                prediction += np.dot(
-                    self.user_factors[user_idx] + implied_vector,
-                    self.item_factors[item_idx],
-                )
-
-                error = true_rating - prediction
+        if self.user_store is None or user_id in self.loaded_users:
+            return
+        self.loaded_users.add(user_id)
+        ratings = self.user_store.load_user(user_id)
+        if ratings is None:
+            return
+        # восстановление без повторной записи в хранилище
+        user_store, self.user_store = self.user_store, None
+        try:
+            self.create_virtual_user(user_id)
+            for movie_id, rating in ratings.items():
+                self.update_virtual_user(user_id, movie_id, rating)
+        finally:
+            self.user_store = user_store
+        print(f"Виртуальный пользователь {user_id} загружен из хранилища")
+
+    def bump_ratings_version(self, user_id: int) -> None:
+        """
+        Новая версия оценок пользователя: рекомендации, сохраненные для прежних
+        версий, больше не выдаются
 
-                user_grad = (
-                    error * self.item_factors[item_idx]
-                    - self.reg * self.user_factors[user_idx]
-                )
-                user_bias_grad = error - self.reg * self.user_biases[user_idx]
+        :param user_id: ID пользователя
+        """
+        self.ratings_version += 1
+        self.user_versions[user_id] = self.ratings_version
 
-                self.user_factors[user_idx] += self.lr * user_grad
-                self.user_biases[user_idx] += self.lr * user_bias_grad
+    def train_for_user(self, user_id: int):
+        """
+        Вычисление факторов пользователя заново по всем его оценкам
+        (гребневая регрессия при фиксированных факторах фильмов)
 
-            self.lr *= 0.95
+        :param user_id: ID пользователя
+        """
+        print(f"Дообучение модели для пользователя {user_id}")
+        user_idx = self.user_to_idx[user_id]
+        items, ratings = self.ratings_store.row(user_idx)
+        state = FoldInState(self.n_factors, self.fold_in_reg)
+        for item_idx, rating in zip(items, ratings):
+            state.add(
+                self.item_factors[item_idx],
+                rating - self.global_mean - self.item_biases[item_idx],
+            )
+        self.fold_in_states[user_id] = state
+        self.apply_fold_in(user_id)
+
+    def apply_fold_in(self, user_id: int) -> None:
+        """
+        Запись решения гребневой регрессии в факторы и смещение пользователя
 
+        :param user_id: ID пользователя
+        """
+        user_idx = self.user_to_idx[user_id]
+        user_vector, user_bias = self.fold_in_states[user_id].solve(
+            self.get_user_implied_vector(user_idx)
+        )
+        slot = user_idx - len(self.user_biases)
+        self.virtual_factors.factors[slot] = user_vector
+        self.virtual_factors.biases[slot] = user_bias
         self.trained_for_user[user_id] = True
 
     def recommend_for_virtual_user(self, user_id: int, n_recommendations: int) -> list:
         """
-        Рекомендация предметов для пользователя
+        Рекомендация предметов для пользователя.
+        Результат сохраняется в recommendation_cache для текущей версии оценок
+        пользователя и выдается повторно, пока оценки не изменятся.
 
         :param user_id: ID пользователя
         :param n_recommendations: количество рекомендаций
         :return: список рекомендаций
         """
+        self.load_virtual_user(user_id)
         if user_id not in self.user_to_idx:
             print(f"Виртуальный пользователь {user_id} не найден")
             return []
 
+        version = self.user_versions.get(user_id)
+        cached = self.recommendation_cache.get(user_id, version, n_recommendations)
+        if cached is not None:
+            return cached
+
         if not (self.trained_for_user[user_id]):
             self.train_for_user(user_id)
 
-        rated_items = set(self.virtual_users[user_id].keys())
-        predictions = []
-        for item_id in self.all_items:
-            if item_id not in rated_items:
-                pred = self.predict(user_id, item_id)
-                predictions.append((item_id, pred))
-        predictions.sort(key=lambda x: x[1], reverse=True)
-        return predictions[:n_recommendations]
+        recommendations = self.recommend_batch([user_id], n_recommendations)[0]
+        self.recommendation_cache.put(user_id, version, n_recommendations, recommendations)
+        return recommendations
+
+    def recommend_batch(self, user_ids: list, n: int) -> list:
+        """
+        Рекомендация топ-n фильмов сразу для нескольких пользователей.
+        Все оценки считаются одним матричным умножением, уже оцененные фильмы исключаются.
+
+        :param list user_ids: список ID пользователей
+        :param int n: количество рекомендаций для каждого пользователя
+        :return list: списки рекомендаций (ID фильма, предсказанная оценка) в порядке user_ids
+        """
+        known = [uid for uid in user_ids if uid in self.user_to_idx]
+        if not known or n <= 0:
+            return [[] for _ in user_ids]
+
+        user_idxs = np.array([self.user_to_idx[uid] for uid in known])
+        user_factors, user_biases = self.get_user_factors(user_idxs)
+        user_vectors = user_factors + np.array(
+            [self.get_user_implied_vector(idx) for idx in user_idxs]
+        )
+        if self.index is not None:
+            return self._recommend_with_index(
+                user_ids, known, user_idxs, user_vectors, user_biases, n
+            )
+
+        scores = user_vectors @ self.item_factors.T
+        scores += self.item_biases
+        scores += (self.global_mean + user_biases)[:, None]
+        for row, user_idx in enumerate(user_idxs):
+            rated, _ = self.ratings_store.row(user_idx)
+            scores[row, rated] = -np.inf
+
+        n = min(n, self.num_items)
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        item_ids = np.asarray(self.all_items)
+        result = {}
+        for row, uid in enumerate(known):
+            valid = np.isfinite(top_scores[row])
+            result[uid] = list(
+                zip(
+                    item_ids[top[row][valid]].tolist(),
+                    np.clip(top_scores[row][valid], 1.0, 5.0).tolist(),
+                )
+            )
+        return [result.get(uid, []) for uid in user_ids]
+
+    def _recommend_with_index(
+        self, user_ids, known, user_idxs, user_vectors, user_biases, n
+    ) -> list:
+        """Выбор рекомендаций через приближенный индекс (для recommend_batch)"""
+        item_ids = np.asarray(self.all_items)
+        result = {}
+        for uid, user_idx, user_vector, user_bias in zip(
+            known, user_idxs, user_vectors, user_biases
+        ):
+            rated, _ = self.ratings_store.row(user_idx)
+            items, scores = self.index.search(user_vector, n, self.n_probe, rated)
+            predictions = np.clip(self.global_mean + user_bias + scores, 1.0, 5.0)
+            result[uid] = list(zip(item_ids[items].tolist(), predictions.tolist()))
+        return [result.get(uid, []) for uid in user_ids]
 
     def get_virtual_user_ratings(self, user_id: int) -> dict:
         """
@@ -263,6 +695,7 @@ class SVDppRecommender:
         :param int user_id: ID пользователя
         :return dict: словарь оценок
         """
+        self.load_virtual_user(user_id)
         if user_id in self.virtual_users:
             return self.virtual_users[user_id]
         else:
@@ -0,0 +1,338 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+BACKENDS = ("numpy", "numba")
+# поэлементный SGD исходного алгоритма, если numba установлена, иначе мини-пакеты NumPy
+DEFAULT_BACKEND = "numba" if njit is not None else "numpy"
+
+
+def scatter_add_rows(target: np.ndarray, rows: np.ndarray, values: np.ndarray) -> None:
+    """
+    Прибавление строк values к строкам target с индексами rows (с повторами).
+    Работает через одномерный np.add.at, что заметно быстрее двумерного.
+
+    :param np.ndarray target: C-непрерывная матрица (изменяется на месте)
+    :param np.ndarray rows: индексы строк
+    :param np.ndarray values: прибавляемые строки
+    """
+    k = target.shape[1]
+    flat_idx = (rows[:, None].astype(np.intp) * k + np.arange(k)).ravel()
+    np.add.at(target.reshape(-1), flat_idx, values.ravel())
+
+
+def implicit_norms(user_idx: np.ndarray, num_users: int, learned: bool) -> np.ndarray:
+    """
+    Нормировочные множители неявного вектора для каждого пользователя:
+    1/|N(u)| для усреднения факторов фильмов или |N(u)|^-1/2 для настоящего SVD++
+
+    :param np.ndarray user_idx: индексы пользователей (COO)
+    :param int num_users: количество пользователей
+    :param bool learned: используются ли отдельные неявные факторы y_j
+    :return np.ndarray: множители (0 для пользователей без оценок)
+    """
+    counts = np.bincount(user_idx, minlength=num_users).astype(np.float64)
+    norms = np.zeros(num_users)
+    nonzero = counts > 0
+    norms[nonzero] = 1.0 / (np.sqrt(counts[nonzero]) if learned else counts[nonzero])
+    return norms
+
+
+def compute_implied_vectors(
+    user_idx: np.ndarray,
+    item_idx: np.ndarray,
+    item_factors: np.ndarray,
+    num_users: int,
+    implicit_factors: np.ndarray = None,
+) -> np.ndarray:
+    """
+    Вычисление векторов неявных предпочтений сразу для всех пользователей:
+    среднее факторов оцененных фильмов, а при заданных implicit_factors —
+    сумма y_j, нормированная на |N(u)|^-1/2
+
+    :param np.ndarray user_idx: индексы пользователей (COO)
+    :param np.ndarray item_idx: индексы фильмов (COO)
+    :param np.ndarray item_factors: матрица факторов фильмов
+    :param int num_users: количество пользователей
+    :param np.ndarray implicit_factors: матрица неявных факторов y_j (SVD++)
+    :return np.ndarray: матрица векторов неявных предпочтений
+    """
+    learned = implicit_factors is not None
+    factors = implicit_factors if learned else item_factors
+    implied = np.zeros((num_users, factors.shape[1]))
+    scatter_add_rows(implied, user_idx, factors[item_idx])
+    implied *= implicit_norms(user_idx, num_users, learned)[:, None]
+    return implied
+
+
+def sgd_epoch_numpy(
+    user_idx: np.ndarray,
+    item_idx: np.ndarray,
+    ratings: np.ndarray,
+    user_factors: np.ndarray,
+    user_biases: np.ndarray,
+    item_factors: np.ndarray,
+    item_biases: np.ndarray,
+    global_mean: float,
+    lr: float,
+    reg: float,
+    batch_size: int = 1024,
+    rng: np.random.Generator = None,
+) -> float:
+    """
+    Эпоха мини-пакетного SGD на массивах NumPy.
+    Векторы неявных предпочтений пересчитываются один раз за эпоху,
+    градиенты внутри пакета суммируются через np.add.at.
+
+    :param np.ndarray user_idx: индексы пользователей (COO)
+    :param np.ndarray item_idx: индексы фильмов (COO)
+    :param np.ndarray ratings: оценки (COO)
+    :param np.ndarray user_factors: матрица факторов пользователей (изменяется на месте)
+    :param np.ndarray user_biases: смещения пользователей (изменяются на месте)
+    :param np.ndarray item_factors: матрица факторов фильмов (изменяется на месте)
+    :param np.ndarray item_biases: смещения фильмов (изменяются на месте)
+    :param float global_mean: средняя оценка
+    :param float lr: скорость обучения
+    :param float reg: параметр регуляризации
+    :param int batch_size: размер мини-пакета
+    :param np.random.Generator rng: генератор для перемешивания оценок
+    :return float: сумма квадратов ошибок за эпоху
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    implied = compute_implied_vectors(
+        user_idx, item_idx, item_factors, user_factors.shape[0]
+    )
+    order = rng.permutation(len(ratings))
+    total_loss = 0.0
+    for start in range(0, len(order), batch_size):
+        batch = order[start : start + batch_size]
+        users = user_idx[batch]
+        items = item_idx[batch]
+
+        p = user_factors[users]
+        q = item_factors[items]
+        user_vectors = p + implied[users]
+        bu = user_biases[users]
+        bi = item_biases[items]
+
+        predictions = global_mean + bu + bi + np.einsum("ij,ij->i", user_vectors, q)
+        errors = ratings[batch] - predictions
+        total_loss += float(errors @ errors)
+
+        scatter_add_rows(user_factors, users, lr * (errors[:, None] * q - reg * p))
+        scatter_add_rows(
+            item_factors, items, lr * (errors[:, None] * user_vectors - reg * q)
+        )
+        np.add.at(user_biases, users, lr * (errors - reg * bu))
+        np.add.at(item_biases, items, lr * (errors - reg * bi))
+    return total_loss
+
+
+def _sgd_epoch_sequential(
+    user_idx,
+    item_idx,
+    ratings,
+    user_factors,
+    user_biases,
+    item_factors,
+    item_biases,
+    implicit_factors,
+    learned,
+    global_mean,
+    lr,
+    reg,
+    reg_implicit,
+):
+    """
+    Поэлементный SGD в том же порядке, что и исходный цикл по пользователям.
+    Оценки должны быть отсортированы по пользователю.
+    При learned=True неявный вектор строится по y_j и кэшируется на время
+    обработки пользователя, а y_j обновляются один раз после него.
+    """
+    n = len(ratings)
+    k = user_factors.shape[1]
+    implied = np.zeros(k)
+    implied_grad = np.zeros(k)
+    total_loss = 0.0
+    start = 0
+    while start < n:
+        u = user_idx[start]
+        end = start
+        while end < n and user_idx[end] == u:
+            end += 1
+
+        implied[:] = 0.0
+        implied_grad[:] = 0.0
+        if learned:
+            for s in range(start, end):
+                implied += implicit_factors[item_idx[s]]
+            norm = 1.0 / np.sqrt(end - start)
+        else:
+            for s in range(start, end):
+                implied += item_factors[item_idx[s]]
+            norm = 1.0 / (end - start)
+        implied *= norm
+
+        for s in range(start, end):
+            i = item_idx[s]
+            prediction = global_mean + user_biases[u] + item_biases[i]
+            for f in range(k):
+                prediction += (user_factors[u, f] + implied[f]) * item_factors[i, f]
+            error = ratings[s] - prediction
+            total_loss += error * error
+
+            for f in range(k):
+                puf = user_factors[u, f]
+                qif = item_factors[i, f]
+                implied_grad[f] += error * qif
+                user_factors[u, f] += lr * (error * qif - reg * puf)
+                item_factors[i, f] += lr * (error * (puf + implied[f]) - reg * qif)
+            bu = user_biases[u]
+            bi = item_biases[i]
+            user_biases[u] += lr * (error - reg * bu)
+            item_biases[i] += lr * (error - reg * bi)
+
+        if learned:
+            for s in range(start, end):
+                j = item_idx[s]
+                for f in range(k):
+                    implicit_factors[j, f] += lr * (
+                        norm * implied_grad[f] - reg_implicit * implicit_factors[j, f]
+                    )
+        start = end
+    return total_loss
+
+
+if njit is not None:
+    _sgd_epoch_sequential_jit = njit(cache=True, nogil=True)(_sgd_epoch_sequential)
+else:
+    _sgd_epoch_sequential_jit = None
+
+
+def sgd_epoch_numba(
+    user_idx: np.ndarray,
+    item_idx: np.ndarray,
+    ratings: np.ndarray,
+    user_factors: np.ndarray,
+    user_biases: np.ndarray,
+    item_factors: np.ndarray,
+    item_biases: np.ndarray,
+    global_mean: float,
+    lr: float,
+    reg: float,
+    implicit_factors: np.ndarray = None,
+    reg_implicit: float = None,
+) -> float:
+    """
+    Эпоха поэлементного SGD, скомпилированная Numba.
+    Повторяет исходный алгоритм, поэтому кривая потерь совпадает с ним.
+    Без numba выполняется тот же цикл на чистом Python (очень медленно,
+    поэтому resolve_backend такой режим не выбирает).
+
+    :param np.ndarray user_idx: индексы пользователей (COO, отсортированы)
+    :param np.ndarray item_idx: индексы фильмов (COO)
+    :param np.ndarray ratings: оценки (COO)
+    :param np.ndarray user_factors: матрица факторов пользователей (изменяется на месте)
+    :param np.ndarray user_biases: смещения пользователей (изменяются на месте)
+    :param np.ndarray item_factors: матрица факторов фильмов (изменяется на месте)
+    :param np.ndarray item_biases: смещения фильмов (изменяются на месте)
+    :param float global_mean: средняя оценка
+    :param float lr: скорость обучения
+    :param float reg: параметр регуляризации
+    :param np.ndarray implicit_factors: матрица неявных факторов y_j (изменяется на месте)
+    :param float reg_implicit: регуляризация y_j (по умолчанию reg)
+    :return float: сумма квадратов ошибок за эпоху
+    """
+    kernel = _sgd_epoch_sequential_jit or _sgd_epoch_sequential
+    return kernel(
+        user_idx,
+        item_idx,
+        ratings,
+        user_factors,
+        user_biases,
+        item_factors,
+        item_biases,
+        item_factors if implicit_factors is None else implicit_factors,
+        implicit_factors is not None,
+        float(global_mean),
+        float(lr),
+        float(reg),
+        float(reg if reg_implicit is None else reg_implicit),
+    )
+
+
+def sgd_epoch(
+    backend: str,
+    user_idx: np.ndarray,
+    item_idx: np.ndarray,
+    ratings: np.ndarray,
+    user_factors: np.ndarray,
+    user_biases: np.ndarray,
+    item_factors: np.ndarray,
+    item_biases: np.ndarray,
+    global_mean: float,
+    lr: float,
+    reg: float,
+    batch_size: int = 1024,
+    rng: np.random.Generator = None,
+    implicit_factors: np.ndarray = None,
+    reg_implicit: float = None,
+) -> float:
+    """
+    Эпоха SGD выбранным движком (параметры — как у sgd_epoch_numpy/sgd_epoch_numba)
+
+    :param str backend: 'numpy' или 'numba'
+    :return float: сумма квадратов ошибок за эпоху
+    """
+    args = (
+        user_idx,
+        item_idx,
+        ratings,
+        user_factors,
+        user_biases,
+        item_factors,
+        item_biases,
+        global_mean,
+        lr,
+        reg,
+    )
+    if backend == "numba":
+        return sgd_epoch_numba(
+            *args,
+            implicit_factors=implicit_factors,
+            reg_implicit=reg_implicit,
+        )
+    return sgd_epoch_numpy(*args, batch_size=batch_size, rng=rng)
+
+
+def resolve_backend(backend: str, learned: bool = False) -> str:
+    """
+    Проверка выбранного движка обучения.
+    Настоящий SVD++ (learned=True) обучается только поэлементным SGD:
+    неявные векторы должны учитывать обновления y_j от предыдущих пользователей,
+    а при пакетной обработке такая задержка приводит к расходимости.
+    Без numba такой цикл слишком медленный, поэтому он недоступен (ValueError).
+
+    :param str backend: 'numpy' или 'numba'
+    :param bool learned: используются ли отдельные неявные факторы y_j
+    :return str: движок, который будет использован
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный backend '{backend}', доступны: {BACKENDS}")
+    if learned and njit is None:
+        raise ValueError(
+            "Для implicit_mode='learned' нужен пакет numba "
+            "(без него доступен только implicit_mode='shared')"
+        )
+    if learned and backend == "numpy":
+        print("Для implicit_mode='learned' используется поэлементный backend='numba'")
+        backend = "numba"
+    if backend == "numba" and njit is None:
+        print("Пакет numba не установлен, используется backend='numpy'")
+        return "numpy"
+    return backend